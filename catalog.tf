@@ -1,9 +1,5 @@
 locals {
-  catalogs_json = jsondecode(file("${path.module}/.metadata.tmp/catalogs.json"))
-  catalogs = {
-    for x in local.catalogs_json :
-    x.name => x if x.enabled
-  }
+  catalogs = jsondecode(file("${path.module}/.metadata.tmp/keyed/catalogs.json"))
 
   catalog_grants = {
     for name, x in local.catalogs :
@@ -14,19 +10,15 @@ locals {
 resource "databricks_catalog" "catalog" {
   provider      = databricks.admin
   for_each      = local.catalogs
-  metastore_id  = databricks_metastore.this.id
+  metastore_id  = local.metastore_id
   name          = each.key
   force_destroy = false
-  storage_root  = databricks_external_location.storage_location[each.value.storage_location_name].url
+  storage_root  = local.storage_location_urls[each.value.storage_location_name]
   comment       = each.value.comment
   properties = {
     purpose = "testing"
   }
   owner = each.value.role_owner
-
-  depends_on = [
-    databricks_external_location.storage_location
-  ]
 }
 
 module "catalog_grants" {
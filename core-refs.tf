@@ -0,0 +1,17 @@
+# References to core resources (metastore, external locations) used by catalogs and workspaces.
+# In sharded layout dependent shards read them from remote state of core shard instead (see scripts/build_dynamic_providers.py).
+locals {
+  metastore_id = databricks_metastore.this.id
+  storage_location_urls = {
+    for name, x in databricks_external_location.storage_location :
+    name => x.url
+  }
+}
+
+output "metastore_id" {
+  value = local.metastore_id
+}
+
+output "storage_location_urls" {
+  value = local.storage_location_urls
+}
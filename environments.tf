@@ -1,11 +1,7 @@
 locals {
   current_environment = jsondecode(file("${path.module}/.metadata.tmp/current_environment.json"))
-  environments_json   = jsondecode(file("${path.module}/.metadata.tmp/environments.json"))
-  environments = {
-    for x in local.environments_json :
-    x.name => x if x.enabled
-  }
-  environment = local.environments[terraform.workspace]
+  environments        = jsondecode(file("${path.module}/.metadata.tmp/keyed/environments.json"))
+  environment         = local.environments[terraform.workspace]
 }
 
 terraform {
@@ -1,9 +1,6 @@
 locals {
-  metastores_json = jsondecode(file("${path.module}/.metadata.tmp/metastores.json"))
-  metastore_setup = one([
-    for x in local.metastores_json :
-    x if x.enabled
-  ])
+  metastores      = jsondecode(file("${path.module}/.metadata.tmp/keyed/metastores.json"))
+  metastore_setup = one(values(local.metastores))
 }
 
 resource "databricks_metastore" "this" {
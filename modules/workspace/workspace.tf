@@ -1,5 +1,13 @@
 variable "databricks_workspace_id" {}
 variable "databricks_metastore_id" {}
+variable "role_admin" {}
+variable "default_catalog_name" {}
+variable "aad_group_names" {
+  type = set(string)
+}
+variable "aad_group_ids" {
+  type = map(string)
+}
 
 terraform {
   required_providers {
@@ -11,54 +19,19 @@ terraform {
   }
 }
 
-locals {
-  workspace_groups_master_json = jsondecode(file("${path.module}/../../.metadata.tmp/workspace-group-master.json"))
-  workspace_groups_master = {
-    for x in local.workspace_groups_master_json :
-    x.aad_group_name => x if x.enabled
-  }
-
-  workspaces_json = jsondecode(file("${path.module}/../../.metadata.tmp/workspaces.json"))
-  workspaces = {
-    for x in local.workspaces_json :
-    x.workspace_id => x if x.enabled
-  }
-  workspace_cfg = local.workspaces[var.databricks_workspace_id]
-
-  aad_group_names = setunion(keys(local.workspace_groups_master), toset(lookup(local.workspace_cfg, "account_groups", [])))
-}
-
-output "test" {
-  value = local.workspaces
-}
-
 resource "databricks_metastore_assignment" "this" {
   provider             = databricks.account
   metastore_id         = var.databricks_metastore_id
   workspace_id         = var.databricks_workspace_id
-  default_catalog_name = lookup(local.workspace_cfg, "default_catalog_name", "hive_metastore")
-}
-
-data "databricks_group" "some" {
-  for_each                   = local.aad_group_names
-  provider                   = databricks.account
-  display_name               = each.key
-  workspace_access           = false
-  allow_cluster_create       = false
-  allow_instance_pool_create = false
-  databricks_sql_access      = false
-
-  depends_on = [
-    databricks_metastore_assignment.this
-  ]
+  default_catalog_name = var.default_catalog_name
 }
 
 resource "databricks_mws_permission_assignment" "some" {
-  for_each     = local.aad_group_names
+  for_each     = var.aad_group_names
   provider     = databricks.account
   workspace_id = databricks_metastore_assignment.this.workspace_id
-  principal_id = data.databricks_group.some[each.key].id
-  permissions  = each.key == local.workspace_cfg["role_admin"] ? ["ADMIN"] : ["USER"]
+  principal_id = var.aad_group_ids[each.key]
+  permissions  = each.key == var.role_admin ? ["ADMIN"] : ["USER"]
 
   depends_on = [
     databricks_metastore_assignment.this
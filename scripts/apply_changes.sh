@@ -1,2 +1,4 @@
 #!/bin/sh
-sh scripts/plan_changes.sh $1 && terraform apply
+set -f
+sh scripts/plan_changes.sh $1 && terraform apply `cat tfplan.targets` &&
+  python scripts/plan_scope.py snapshot $1
@@ -0,0 +1,82 @@
+import json
+import argparse
+from databricks.sdk import AccountClient
+from typing import List, Dict, Iterator, Any
+import build_metadata_tmp as BMT
+from scim_pages import list_all_scim_pages
+
+def list_account_groups(ac: AccountClient) -> Iterator[Any]:
+  """lists all account groups with their id and display name
+
+  Args:
+      ac (AccountClient): databricks sdk AccountClient
+
+  Yields:
+      Iterator[Any]: account groups
+  """
+  yield from list_all_scim_pages(ac.groups.list, "id,displayName")
+
+def get_account_group_ids(ac: AccountClient, group_names: List[str]) -> Dict[str, str]:
+  """resolves display names of account groups to their ids using one paginated listing
+
+  Args:
+      ac (AccountClient): databricks sdk AccountClient
+      group_names (List[str]): display names of groups to resolve
+
+  Raises:
+      ValueError: when any of groups does not exist in the account
+
+  Returns:
+      Dict[str, str]: display name to id of each requested group
+  """
+  exact_index = {}
+  lower_index = {}
+  for g in list_account_groups(ac):
+    exact_index[g.display_name] = g.id
+    lower_index[g.display_name.lower()] = g.id
+
+  # display names are matched case insensitive as the group lookup in databricks provider does
+  group_ids = {
+    name: exact_index.get(name, lower_index.get(name.lower()))
+    for name in sorted(group_names)
+  }
+
+  missing = [name for name, id in group_ids.items() if id is None]
+  if missing:
+    raise ValueError(f"Groups not found in databricks account: {missing}")
+
+  return group_ids
+
+def get_workspace_group_names(workspace_configs_file: str='.metadata.tmp/workspace-configs.json') -> List[str]:
+  """gets names of all groups assigned to any workspace
+
+  Args:
+      workspace_configs_file (str): file with precomputed workspace configurations (default: .metadata.tmp/workspace-configs.json)
+
+  Returns:
+      List[str]: unique list of group names, sorted alphabetically
+  """
+  with open(workspace_configs_file) as json_file:
+    workspace_configs = json.load(json_file)
+
+  groups = set()
+  for w in workspace_configs.values():
+    groups.update(w['aad_group_names'])
+
+  return sorted(groups)
+
+if __name__ == "__main__":
+  arg_parser = argparse.ArgumentParser()
+  arg_parser.add_argument("--output-format", choices=BMT.OUTPUT_FORMATS, default="pretty", help="pretty (indented) or compact json output file (default: pretty)")
+  args = arg_parser.parse_args()
+
+  env_setup = BMT.load_json_from_file(".metadata.tmp/current_environment.json")
+  ac = AccountClient(host="https://accounts.azuredatabricks.net", account_id=env_setup['databricks_account_id'])
+
+  group_ids = get_account_group_ids(ac, get_workspace_group_names())
+
+  output_file_name = ".metadata.tmp/account-groups.json"
+  if BMT.write_file_if_changed(output_file_name, BMT.iter_json_chunks(group_ids, args.output_format)):
+    print(f"- Creating file {output_file_name}")
+  else:
+    print(f"- Unchanged file {output_file_name}")
@@ -1,9 +1,15 @@
+import os
 import json
 import re
+import time
+import hashlib
+import threading
 from datetime import datetime
 import argparse
+from concurrent.futures import ThreadPoolExecutor, Future
 from databricks.sdk import WorkspaceClient, AccountClient
-from typing import Optional
+from databricks.sdk.core import DatabricksError
+from typing import Optional, Callable, List, Dict, Any, Union, Tuple
 
 def generate_import_snippet(provider:str, id:str, to:str) -> str:
   """generates terraform's 1.5 import block for given resource
@@ -33,24 +39,22 @@ def get_json_dict(file_name:str):
     return d
 
 def get_json_records(file_name:str):
-  """returns records from json file
+  """returns records from keyed json file, which contains only enabled records
 
   Args:
-      file_name (str): name of json file containing list of objects as it's contents
+      file_name (str): name of json file containing object of key to record as it's contents
 
   Yields:
       Iterator: iterator for each record in a file
   """  
   with open(file_name) as json_file:
-    for d in json.load(json_file):
-      if "enabled" not in d or d['enabled']:
-        yield d
+    yield from json.load(json_file).values()
         
 def get_single_json_record(file_name:str) -> dict:
   """returns single entry from json file
 
   Args:
-      file_name (str): name of json file containing list of objects as it's contents
+      file_name (str): name of json file containing object of key to record as it's contents
 
   Raises:
       ValueError: in case file contains no, or more than 1 record exception is returned
@@ -64,6 +68,17 @@ def get_single_json_record(file_name:str) -> dict:
   
   return records[0]
 
+def is_not_found_error(e: DatabricksError) -> bool:
+  """checks if API error means that requested object does not exist, other errors (throttling, 5xx, auth) must not be treated as missing object
+
+  Args:
+      e (DatabricksError): error raised by sdk
+
+  Returns:
+      bool: True for not found errors
+  """
+  return e.error_code in ('NOT_FOUND', 'RESOURCE_DOES_NOT_EXIST') or str(e.error_code).endswith('_DOES_NOT_EXIST')
+
 def get_uc_catalog(wc: WorkspaceClient, name: str) -> Optional[dict]:
   """gets uc catalog defintion
 
@@ -73,11 +88,16 @@ def get_uc_catalog(wc: WorkspaceClient, name: str) -> Optional[dict]:
 
   Returns:
       Optional[dict]: None if catalog does not exist, otherwise dictionary with result of API call
+
+  Raises:
+      DatabricksError: on any other API error, so it's not cached as missing object
   """  
   try:
     return wc.catalogs.get(name)
-  except Exception:
-    return None
+  except DatabricksError as e:
+    if is_not_found_error(e):
+      return None
+    raise
 
 def get_uc_storage_credentials(wc: WorkspaceClient, name: str) -> Optional[dict]:
   """gets uc storage credentials
@@ -88,11 +108,16 @@ def get_uc_storage_credentials(wc: WorkspaceClient, name: str) -> Optional[dict]
 
   Returns:
       Optional[dict]: None if name does not exist, otherwise dictionary with result of API call
+
+  Raises:
+      DatabricksError: on any other API error, so it's not cached as missing object
   """  
   try:
     return wc.storage_credentials.get(name)
-  except Exception:
-    return None
+  except DatabricksError as e:
+    if is_not_found_error(e):
+      return None
+    raise
   
 def get_uc_external_locations(wc: WorkspaceClient, name: str) -> Optional[dict]:
   """gets uc external location
@@ -103,36 +128,325 @@ def get_uc_external_locations(wc: WorkspaceClient, name: str) -> Optional[dict]:
 
   Returns:
       Optional[dict]: None if name does not exist, otherwise dictionary with result of API call
+
+  Raises:
+      DatabricksError: on any other API error, so it's not cached as missing object
   """  
   try:
     return wc.external_locations.get(name)
-  except Exception:
-    return None
+  except DatabricksError as e:
+    if is_not_found_error(e):
+      return None
+    raise
   
-def get_uc_metastore(wc: WorkspaceClient, name: str):
-  """gets uc metastore
+_metastores_index: Dict[str, Dict[str, Any]] = {}
+_metastores_index_lock = threading.Lock()
+
+def get_uc_metastores_index(wc: WorkspaceClient) -> Dict[str, Any]:
+  """gets index of all uc metastores visible to the workspace, listed only once per process
+
+  Args:
+      wc (WorkspaceClient): databricks sdk WorkspaceClient
+
+  Returns:
+      Dict[str, Any]: dictionary of metastore name to result of API call
+  """
+  with _metastores_index_lock:
+    if wc.config.host not in _metastores_index:
+      _metastores_index[wc.config.host] = {m.name: m for m in wc.metastores.list()}
+
+    return _metastores_index[wc.config.host]
+
+def get_uc_metastore(wc: WorkspaceClient, name: str) -> Optional[Any]:
+  """gets uc metastore, the metastore assigned to the workspace is checked first, so that listing all metastores is needed only when names do not match
 
   Args:
       wc (WorkspaceClient): databricks sdk WorkspaceClient
       name (str): name of the metasotre
 
   Returns:
-      Optional[dict]: None if name does not exist, otherwise dictionary with result of API call
+      Optional[Any]: None if name does not exist, otherwise result of API call (with `metastore_id` attribute)
   """  
   try:
-    for m in wc.metastores.list():
-      if m.name == name:
-        return m 
+    current = wc.metastores.summary()
+  except DatabricksError:
+    current = None
+
+  if current and current.name == name:
+    return current
+
+  return get_uc_metastores_index(wc).get(name)
+
+class HostRateLimiter:
+  """thread safe limiter spacing out API calls made against single host"""
+
+  def __init__(self, max_requests_per_second: float):
+    self._interval = 1.0 / max_requests_per_second if max_requests_per_second > 0 else 0.0
+    self._lock = threading.Lock()
+    self._next_slot = 0.0
+
+  def wait(self) -> None:
+    """blocks until the next request slot for the host is available"""
+    if not self._interval:
+      return
+
+    with self._lock:
+      now = time.monotonic()
+      slot = max(now, self._next_slot)
+      self._next_slot = slot + self._interval
+
+    if slot > now:
+      time.sleep(slot - now)
+
+_host_rate_limiters: Dict[str, HostRateLimiter] = {}
+
+def get_host_rate_limiter(host: str, max_requests_per_second: float) -> HostRateLimiter:
+  """gets rate limiter shared by all calls to given host
+
+  Args:
+      host (str): databricks host url
+      max_requests_per_second (float): maximum number of requests per second sent to the host (0 = unlimited)
+
+  Returns:
+      HostRateLimiter: rate limiter for the host
+  """
+  if host not in _host_rate_limiters:
+    _host_rate_limiters[host] = HostRateLimiter(max_requests_per_second)
+
+  return _host_rate_limiters[host]
+
+def probe_uc_objects(executor: ThreadPoolExecutor, wc: WorkspaceClient, get_fn: Callable, names: List[str], rate_limiter: HostRateLimiter) -> list:
+  """submits existence checks of uc objects to the worker pool
+
+  Args:
+      executor (ThreadPoolExecutor): worker pool running the checks
+      wc (WorkspaceClient): databricks sdk WorkspaceClient
+      get_fn (Callable): one of `get_uc_*` functions used to check the object
+      names (List[str]): names of objects to check
+      rate_limiter (HostRateLimiter): rate limiter of workspace host
+
+  Returns:
+      list: futures with results of `get_fn`, in the same order as `names`
+  """
+  def _probe(name):
+    rate_limiter.wait()
+    return get_fn(wc, name)
+
+  return [executor.submit(_probe, name) for name in names]
+
+def index_uc_objects(executor: ThreadPoolExecutor, list_fn: Callable, rate_limiter: HostRateLimiter) -> Future:
+  """submits single listing of all uc objects of given type to the worker pool
+
+  Args:
+      executor (ThreadPoolExecutor): worker pool running the listing
+      list_fn (Callable): sdk list method, i.e. `wc.catalogs.list`
+      rate_limiter (HostRateLimiter): rate limiter of workspace host
+
+  Returns:
+      Future: future with dictionary of lowercased object name to the object returned by API
+  """
+  def _list():
+    rate_limiter.wait()
+    return {o.name.lower(): o for o in list_fn()}
+
+  return executor.submit(_list)
+
+def get_existing_uc_objects(names: List[str], found: Union[Future, List[Future]]) -> Dict[str, Any]:
+  """intersects names from metadata with the objects found in databricks
+
+  Args:
+      names (List[str]): names of objects defined in metadata
+      found (Union[Future, List[Future]]): result of `index_uc_objects(...)` or `probe_uc_objects(...)`
+
+  Returns:
+      Dict[str, Any]: dictionary of name to API object, for the names that exist in databricks
+  """
+  if isinstance(found, list):
+    return {
+      name: f.result()
+      for name, f in zip(names, found)
+      if f.result()
+    }
+
+  index = found.result()
+  return {
+    name: index[name.lower()]
+    for name in names
+    if name.lower() in index
+  }
+
+def discover_uc_objects(executor: ThreadPoolExecutor, wc: WorkspaceClient, names: List[str], list_fn: Callable, get_fn: Callable, rate_limiter: HostRateLimiter, bulk: bool) -> Union[Future, List[Future]]:
+  """submits existence checks for given names, either as one listing or as one probe per name
+
+  Args:
+      executor (ThreadPoolExecutor): worker pool running the checks
+      wc (WorkspaceClient): databricks sdk WorkspaceClient
+      names (List[str]): names of objects to check, when empty no API call is made
+      list_fn (Callable): sdk list method used in bulk mode
+      get_fn (Callable): one of `get_uc_*` functions used in probe mode
+      rate_limiter (HostRateLimiter): rate limiter of workspace host
+      bulk (bool): use single listing instead of probes
+
+  Returns:
+      Union[Future, List[Future]]: value to pass to `get_existing_uc_objects(...)`
+  """
+  if bulk and names:
+    return index_uc_objects(executor, list_fn, rate_limiter)
+
+  return probe_uc_objects(executor, wc, get_fn, names, rate_limiter)
+
+def get_record_hash(record: dict) -> str:
+  """gets hash of metadata record, used to invalidate cached probe results when record changes
+
+  Args:
+      record (dict): metadata record
+
+  Returns:
+      str: sha256 hex digest of the record
+  """
+  return hashlib.sha256(json.dumps(record, sort_keys=True).encode('utf-8')).hexdigest()
+
+def load_uc_objects_cache(file_name: str) -> dict:
+  """loads cache of uc objects existence checks
+
+  Args:
+      file_name (str): cache file name
+
+  Returns:
+      dict: cache contents, empty when file is missing or corrupted
+  """
+  try:
+    return get_json_dict(file_name)
+  except (OSError, ValueError):
+    return {}
+
+def save_uc_objects_cache(cache: dict, file_name: str) -> None:
+  """saves cache of uc objects existence checks
+
+  Args:
+      cache (dict): cache contents
+      file_name (str): cache file name
+  """
+  os.makedirs(os.path.dirname(file_name), exist_ok=True)
+  with open(file_name, 'w') as f:
+    f.write(json.dumps(cache, indent=2, sort_keys=True))
 
-  except Exception:
-    return None
+def split_cached_records(cache: dict, resource_type: str, records: List[dict], ttl: float) -> Tuple[Dict[str, Optional[str]], List[str]]:
+  """splits records into ones with fresh cached check result and ones that need to be checked in databricks
+
+  Args:
+      cache (dict): cache contents
+      resource_type (str): name of the dataset the records come from
+      records (List[dict]): metadata records
+      ttl (float): max age of cached result in seconds
+
+  Returns:
+      Tuple[Dict[str, Optional[str]], List[str]]: dictionary of name to cached import id (None if object did not exist), and list of names to check
+  """
+  now = time.time()
+  cached = {}
+  missing = []
+  
+  for record in records:
+    entry = cache.get(f"{resource_type}/{record['name']}")
+    if entry and entry['record_hash'] == get_record_hash(record) and now - entry['checked_at'] < ttl:
+      cached[record['name']] = entry['id']
+    else:
+      missing.append(record['name'])
+  
+  return cached, missing
+
+def update_uc_objects_cache(cache: dict, resource_type: str, records: List[dict], cached: Dict[str, Optional[str]], found: Dict[str, str]) -> Dict[str, str]:
+  """stores results of this run's checks in cache and merges them with cached results.
+  Entries of records which are no longer enabled are removed, so an object destroyed while its record was disabled or removed
+  is checked again once the record comes back, instead of reusing its cached import id.
+
+  Args:
+      cache (dict): cache contents
+      resource_type (str): name of the dataset the records come from
+      records (List[dict]): metadata records
+      cached (Dict[str, Optional[str]]): cached results obtained from `split_cached_records(...)`
+      found (Dict[str, str]): name to import id of objects found in databricks during this run
+
+  Returns:
+      Dict[str, str]: name to import id of all existing objects
+  """
+  now = time.time()
+  existing = {}
+  
+  names = {record['name'] for record in records}
+  for key in [k for k in cache if k.startswith(f"{resource_type}/") and k[len(resource_type) + 1:] not in names]:
+    del cache[key]
+  
+  for record in records:
+    name = record['name']
+    if name in cached:
+      id = cached[name]
+    else:
+      id = found.get(name)
+      cache[f"{resource_type}/{name}"] = {
+        'id': id,
+        'record_hash': get_record_hash(record),
+        'checked_at': now
+      }
+    
+    if id:
+      existing[name] = id
+  
+  return existing
   
 if __name__ == "__main__":
+  arg_parser = argparse.ArgumentParser()
+  arg_parser.add_argument("--discovery", choices=["bulk", "probe"], default="bulk", help="bulk: list each object type once, probe: get each object by name (default: bulk)")
+  arg_parser.add_argument("--workers", type=int, default=8, help="number of concurrent existence checks (default: 8)")
+  arg_parser.add_argument("--max-requests-per-second", type=float, default=20, help="maximum api calls per second per databricks host, 0 = unlimited (default: 20)")
+  arg_parser.add_argument("--cache-ttl", type=float, default=3600, help="seconds for which cached existence checks are reused, 0 = do not use cache (default: 3600)")
+  arg_parser.add_argument("--refresh", action="store_true", help="ignore cached existence checks and check all objects again")
+  args = arg_parser.parse_args()
+
   env_setup = get_json_dict(".metadata.tmp/current_environment.json")
   dbr_host = env_setup['admin_databricks_worskapce_url']
   dbr_account_id = env_setup['databricks_account_id']
   wc = WorkspaceClient(host=dbr_host)
   
+  rate_limiter = get_host_rate_limiter(dbr_host, args.max_requests_per_second)
+
+  cache_file = f".metadata.tmp/.cache/uc-objects-{env_setup['name']}.json"
+  cache = {} if args.refresh else load_uc_objects_cache(cache_file)
+  bulk = args.discovery == "bulk"
+
+  catalogs = list(get_json_records(".metadata.tmp/keyed/catalogs.json"))
+  metastores = [get_single_json_record(".metadata.tmp/keyed/metastores.json")]
+  storage_credentials = list(get_json_records(".metadata.tmp/keyed/storage-credentials.json"))
+  storage_locations = list(get_json_records(".metadata.tmp/keyed/storage-locations.json"))
+
+  catalogs_cached, catalogs_missing = split_cached_records(cache, 'catalogs', catalogs, args.cache_ttl)
+  metastores_cached, metastores_missing = split_cached_records(cache, 'metastores', metastores, args.cache_ttl)
+  storage_credentials_cached, storage_credentials_missing = split_cached_records(cache, 'storage-credentials', storage_credentials, args.cache_ttl)
+  storage_locations_cached, storage_locations_missing = split_cached_records(cache, 'storage-locations', storage_locations, args.cache_ttl)
+
+  #fire all existence checks at once, results are consumed in metadata order below
+  with ThreadPoolExecutor(max_workers=max(1, args.workers)) as executor:
+    catalogs_found = discover_uc_objects(executor, wc, catalogs_missing, wc.catalogs.list, get_uc_catalog, rate_limiter, bulk)
+    metastores_found = probe_uc_objects(executor, wc, get_uc_metastore, metastores_missing, rate_limiter)
+    storage_credentials_found = discover_uc_objects(executor, wc, storage_credentials_missing, wc.storage_credentials.list, get_uc_storage_credentials, rate_limiter, bulk)
+    storage_locations_found = discover_uc_objects(executor, wc, storage_locations_missing, wc.external_locations.list, get_uc_external_locations, rate_limiter, bulk)
+
+  existing_catalogs = update_uc_objects_cache(cache, 'catalogs', catalogs, catalogs_cached, {
+    name: name for name in get_existing_uc_objects(catalogs_missing, catalogs_found)
+  })
+  existing_metastores = update_uc_objects_cache(cache, 'metastores', metastores, metastores_cached, {
+    name: m.metastore_id for name, m in get_existing_uc_objects(metastores_missing, metastores_found).items()
+  })
+  existing_storage_credentials = update_uc_objects_cache(cache, 'storage-credentials', storage_credentials, storage_credentials_cached, {
+    name: name for name in get_existing_uc_objects(storage_credentials_missing, storage_credentials_found)
+  })
+  existing_storage_locations = update_uc_objects_cache(cache, 'storage-locations', storage_locations, storage_locations_cached, {
+    name: name for name in get_existing_uc_objects(storage_locations_missing, storage_locations_found)
+  })
+  
+  save_uc_objects_cache(cache, cache_file)
+  
   with open('dynamic-imports.tf', 'w') as out:
     out.write(f"""#
 # This file was auto generated by {__file__} script.
@@ -145,34 +459,33 @@ if __name__ == "__main__":
     
     #catalogs
     out.write("\n#\n# catalogs\n#\n")
-    for d in get_json_records(".metadata.tmp/catalogs.json"):
-      if get_uc_catalog(wc, d['name']):   
-        id = '"' + d['name'] + '"'
+    for d in catalogs:
+      if d['name'] in existing_catalogs:   
+        id = '"' + existing_catalogs[d['name']] + '"'
         to = f'databricks_catalog.catalog[{id}]'
         out.write(generate_import_snippet(databricks_admin_provider, id, to))
     
     #metastores
     out.write("\n#\n# metastores\n#\n")
-    d = get_single_json_record(".metadata.tmp/metastores.json")
-    metastore = get_uc_metastore(wc, d['name'])
-    if metastore:
-      id = '"' + metastore.metastore_id + '"'
-      to = 'databricks_metastore.this'
-      out.write(generate_import_snippet(databricks_account_provider, id, to))
+    for d in metastores:
+      if d['name'] in existing_metastores:
+        id = '"' + existing_metastores[d['name']] + '"'
+        to = 'databricks_metastore.this'
+        out.write(generate_import_snippet(databricks_account_provider, id, to))
     
     #storage-credentials
     out.write("\n#\n# storage-credentials\n#\n")
-    for d in get_json_records(".metadata.tmp/storage-credentials.json"):
-      if get_uc_storage_credentials(wc, d['name']):
-        id = '"' + d['name'] + '"'
+    for d in storage_credentials:
+      if d['name'] in existing_storage_credentials:
+        id = '"' + existing_storage_credentials[d['name']] + '"'
         to = f'databricks_storage_credential.storage_credential[{id}]'
         out.write(generate_import_snippet(databricks_account_provider, id, to))
       
     #storage-locations
     out.write("\n#\n# storage-locations\n#\n")
-    for d in get_json_records(".metadata.tmp/storage-locations.json"):
-      if get_uc_external_locations(wc, d['name']):
-        id = '"' + d['name'] + '"'
+    for d in storage_locations:
+      if d['name'] in existing_storage_locations:
+        id = '"' + existing_storage_locations[d['name']] + '"'
         to = f'databricks_external_location.storage_location[{id}]'
         out.write(generate_import_snippet(databricks_admin_provider, id, to))
       
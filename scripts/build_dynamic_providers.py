@@ -1,29 +1,57 @@
-import json
+import os
 import re
+import json
+import shutil
 from datetime import datetime
 import argparse
+from typing import Optional, List, Dict
 
-if __name__ == "__main__":
-  arg_parser = argparse.ArgumentParser()
-  arg_parser.add_argument("env_name")
-  args = arg_parser.parse_args()
-  
-  #load current enviroment
-  with open(".metadata.tmp/current_environment.json") as json_file:
-    env = json.load(json_file)
-    if not bool(env['enabled']) or env['name'] != args.env_name:
-      raise ValueError(f'Invalid env_name: {args.env_name}')
-        
-  #create providers / modules
-  with open('dynamic-providers.tf', 'w') as out:
-    out.write(f"""#
+SHARDS_FOLDER = '.shards'
+
+# Optional sharded layout, one terraform root and state per resource group. Every shard gets environments.tf (providers),
+# modules and .metadata.tmp, shards with `depends_on` read core references (see core-refs.tf) from remote state of the core shard.
+SHARDS = {
+  'core': {
+    'files': ['metastores.tf', 'storage-credentials.tf', 'storage-locations.tf', 'core-refs.tf']
+    ,'import_types': ['databricks_metastore', 'databricks_storage_credential', 'databricks_external_location']
+    ,'depends_on': []
+  }
+  ,'catalogs': {
+    'files': ['catalog.tf']
+    ,'import_types': ['databricks_catalog']
+    ,'depends_on': ['core']
+  }
+  ,'workspaces': {
+    'files': ['workspaces.tf']
+    ,'import_types': []
+    ,'depends_on': ['core']
+  }
+}
+
+SHARD_COMMON_FILES = ['environments.tf', '.terraform.lock.hcl']
+SHARD_COMMON_FOLDERS = ['modules', '.metadata.tmp']
+
+def get_generated_file_header() -> str:
+  return f"""#
 # This file was auto generated by {__file__} script.
 # Any changes made to this file will be lost.
 #
-""")
-    
-    #configure backend storage for enviroment data
-    out.write(f"""#
+"""
+
+def get_state_key(env: dict, shard: Optional[str]=None) -> str:
+  """gets name of the tfstate blob of the environment, or of its shard
+
+  Args:
+      env (dict): environment setup
+      shard (Optional[str]): name of the shard, None for single state layout
+
+  Returns:
+      str: blob name
+  """
+  return f"env_{env['name']}-terraform.tfstate" if shard is None else f"env_{env['name']}-{shard}-terraform.tfstate"
+
+def get_backend_block(env: dict, shard: Optional[str]=None) -> str:
+  return f"""#
 # configure backend storage for tfstate
 #
 terraform {{
@@ -32,9 +60,128 @@ terraform {{
     resource_group_name  = "{env['tf_state_resource_group_name']}"
     storage_account_name = "{env['tf_state_storage_account_name']}"
     container_name       = "{env['tf_state_container_name']}"
-    key                  = "env_{env['name']}-terraform.tfstate"
+    key                  = "{get_state_key(env, shard)}"
     use_azuread_auth     = true
   }}
 }}
-  """)
+  """
+
+def get_remote_state_block(env: dict, shard: str) -> str:
+  return f"""
+data "terraform_remote_state" "{shard}" {{
+  backend   = "azurerm"
+  workspace = terraform.workspace
+  config = {{
+    subscription_id      = "{env['tf_state_subscription_id']}"
+    resource_group_name  = "{env['tf_state_resource_group_name']}"
+    storage_account_name = "{env['tf_state_storage_account_name']}"
+    container_name       = "{env['tf_state_container_name']}"
+    key                  = "{get_state_key(env, shard)}"
+    use_azuread_auth     = true
+  }}
+}}
+"""
+
+def get_shard_imports(imports_file: str, import_types: List[str]) -> str:
+  """gets import blocks of dynamic-imports.tf targeting given resource types
+
+  Args:
+      imports_file (str): path of dynamic-imports.tf
+      import_types (List[str]): terraform resource types of the shard
+
+  Returns:
+      str: import blocks
+  """
+  try:
+    with open(imports_file) as f:
+      contents = f.read()
+  except FileNotFoundError:
+    return ""
+
+  return "".join(
+    f"\n{block}\n"
+    for block in re.findall(r"import \{[^}]*\}", contents)
+    if re.search(r"to\s*=\s*([\w-]+)\.", block).group(1) in import_types
+  )
+
+def write_dynamic_providers(env: dict, file_name: str='dynamic-providers.tf', shard: Optional[str]=None) -> None:
+  with open(file_name, 'w') as out:
+    out.write(get_generated_file_header())
+
+    #configure backend storage for enviroment data
+    out.write(get_backend_block(env, shard))
+
+def write_shards(env: dict, shards_folder: str=SHARDS_FOLDER) -> Dict[str, str]:
+  """generates terraform root folder of each shard of the environment
+
+  Args:
+      env (dict): environment setup
+      shards_folder (str): root folder for generated shards (default: .shards)
+
+  Returns:
+      Dict[str, str]: name of shard to its folder
+  """
+  shard_folders = {}
+
+  for shard, setup in SHARDS.items():
+    folder = f"{shards_folder}/{env['name']}/{shard}"
+    os.makedirs(folder, exist_ok=True)
+
+    # files of previous layout are removed, state and providers in .terraform are kept
+    for f in os.listdir(folder):
+      if f.endswith('.tf'):
+        os.remove(f"{folder}/{f}")
+
+    for f in SHARD_COMMON_FILES + setup['files']:
+      if os.path.exists(f):
+        shutil.copyfile(f, f"{folder}/{f}")
+
+    for d in SHARD_COMMON_FOLDERS:
+      shutil.copytree(d, f"{folder}/{d}", dirs_exist_ok=True)
+
+    write_dynamic_providers(env, f"{folder}/dynamic-providers.tf", shard)
+
+    with open(f"{folder}/dynamic-imports.tf", 'w') as out:
+      out.write(get_generated_file_header())
+      out.write(get_shard_imports('dynamic-imports.tf', setup['import_types']))
+
+    if setup['depends_on']:
+      with open(f"{folder}/dynamic-remote-state.tf", 'w') as out:
+        out.write(get_generated_file_header())
+        for dependency in setup['depends_on']:
+          out.write(get_remote_state_block(env, dependency))
+
+        out.write("""
+locals {
+  metastore_id          = data.terraform_remote_state.core.outputs.metastore_id
+  storage_location_urls = data.terraform_remote_state.core.outputs.storage_location_urls
+}
+""")
+
+    shard_folders[shard] = folder
+
+  return shard_folders
+
+def load_current_environment(env_name: str) -> dict:
+  #load current enviroment
+  with open(".metadata.tmp/current_environment.json") as json_file:
+    env = json.load(json_file)
+    if not bool(env['enabled']) or env['name'] != env_name:
+      raise ValueError(f'Invalid env_name: {env_name}')
+
+  return env
+
+if __name__ == "__main__":
+  arg_parser = argparse.ArgumentParser()
+  arg_parser.add_argument("env_name")
+  arg_parser.add_argument("--shards", action="store_true", help=f"also generate sharded layout, one terraform root and state per resource group in {SHARDS_FOLDER}/<env>/<shard>")
+  args = arg_parser.parse_args()
+
+  env = load_current_environment(args.env_name)
+
+  #create providers / modules
+  write_dynamic_providers(env)
 
+  if args.shards:
+    for shard, folder in write_shards(env).items():
+      print(f"- Generated shard {shard} in {folder}")
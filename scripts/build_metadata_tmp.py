@@ -1,9 +1,14 @@
 import os
 import glob
 import json
+import hashlib
+import filecmp
+import tempfile
 import argparse
-from typing import Any, List, Dict, Union
-from jsonschema import validate
+from concurrent.futures import ProcessPoolExecutor, Future
+from typing import Any, List, Dict, Union, Optional, Tuple, Iterable, Iterator
+from jsonschema.exceptions import best_match
+from jsonschema.validators import validator_for
 
 def print_header(text: str) -> None:
   """prints message in green color
@@ -25,63 +30,115 @@ def load_json_from_file(file_path:str) -> Any:
   with open(file_path, 'r') as f:
     return json.load(f)
 
-def get_input_files_setup(env_name: str, input_folder:str='metadata', schemas_folder:str='metadata.schemas') -> dict:
+DATASET_NAMES = [
+  'catalogs'
+  ,'storage-credentials'
+  ,'storage-locations'
+  ,'workspaces'
+  ,'metastores'
+  ,'workspace-group-master'
+  ,'environments'
+]
+
+def load_schemas(schemas_folder:str='metadata.schemas') -> Dict[str, dict]:
+  """loads jsonschema of each dataset
+
+  Args:
+      schemas_folder (str): folder containing `<dataset>.json` schema files (default: metadata.schemas)
+
+  Returns:
+      Dict[str, dict]: dictionary of dataset name to its schema
+  """
+  return {
+    dataset: load_json_from_file(f"{schemas_folder}/{dataset}.json")
+    for dataset in DATASET_NAMES
+  }
+
+def list_input_files(input_folder:str='metadata') -> List[str]:
+  """lists json files of all environments and teams, in a single traversal of input folder
+
+  Args:
+      input_folder (str): root folder where enviroment files are stored (defaut: metadata)
+
+  Returns:
+      List[str]: normalized paths of team level, environment level and root level json files (in that order)
+  """
+  paths = glob.glob(f'{input_folder}/*/*/*.json') \
+    + glob.glob(f'{input_folder}/*/*.json') \
+    + glob.glob(f'{input_folder}/*.json')
+
+  return [
+    os.path.normpath(p).replace("\\", "/")
+    for p in paths
+  ]
+
+def get_input_files_setup(env_name: str, input_folder:str='metadata', schemas_folder:str='metadata.schemas', schemas:Optional[Dict[str, dict]]=None, input_files:Optional[List[str]]=None) -> dict:
   """get input structure document containing as key the name of dataset and as values the schemas, key names and file names used to build the dataset
 
   Args:
       env_name (str): name of environment, which will be translated to subfolder name in inputs/ folder
       input_folder (str): root folder where enviroment files are stored (defaut: inputs)
+      schemas_folder (str): folder containing schema files, used when `schemas` are not provided (default: metadata.schemas)
+      schemas (Optional[Dict[str, dict]]): already loaded schemas obtained from `load_schemas(...)` function
+      input_files (Optional[List[str]]): already listed input files obtained from `list_input_files(...)` function
 
   Returns:
       dict: dictionary descring schema, key_name and file_names for each dataset used by terraform scripts
   """
-  
-  def _get_team_input_file_paths(dataset):
-    paths = glob.glob(f'{input_folder}/{env_name}/*/{dataset}.json') \
-      + glob.glob(f'{input_folder}/{env_name}/{dataset}.json') \
-      + glob.glob(f'{input_folder}/{dataset}.json')
-      
-    return [
-      os.path.normpath(p).replace("\\", "/")
-      for p in paths
-    ]
+  if schemas is None:
+    schemas = load_schemas(schemas_folder)
+
+  if input_files is None:
+    input_files = list_input_files(input_folder)
+
+  input_root = os.path.normpath(input_folder).replace("\\", "/")
+
+  def _get_team_input_file_paths(dataset, root_only=False):
+    file_name = f'{dataset}.json'
+    paths = []
+    for p in input_files:
+      parts = p[len(input_root) + 1:].split('/') if p.startswith(input_root + '/') else []
+      if parts == [file_name] or (not root_only and len(parts) > 1 and parts[0] == env_name and parts[-1] == file_name):
+        paths.append(p)
+    
+    return paths
   
   return {
     'catalogs': {
-      'schema': load_json_from_file(f"{schemas_folder}/catalogs.json")
+      'schema': schemas['catalogs']
       ,'key_name': 'name'
       ,'file_names': _get_team_input_file_paths('catalogs')
     }
     ,'storage-credentials': {
-      'schema': load_json_from_file(f"{schemas_folder}/storage-credentials.json")
+      'schema': schemas['storage-credentials']
       ,'key_name': 'name'
       ,'file_names': _get_team_input_file_paths('storage-credentials')
     }
     ,'storage-locations': {
-      'schema': load_json_from_file(f"{schemas_folder}/storage-locations.json")
+      'schema': schemas['storage-locations']
       ,'key_name': 'name'
       ,'file_names': _get_team_input_file_paths('storage-locations')
     }
     ,'workspaces': {
-      'schema': load_json_from_file(f"{schemas_folder}/workspaces.json")
+      'schema': schemas['workspaces']
       ,'key_name': 'workspace_resource_id'
       ,'file_names': _get_team_input_file_paths('workspaces')
     }
     ,'metastores': {
-      'schema': load_json_from_file(f"{schemas_folder}/metastores.json")
+      'schema': schemas['metastores']
       ,'key_name': 'name'
       ,'file_names': _get_team_input_file_paths('metastores')
     }
     ,'workspace-group-master': {
-      'schema': load_json_from_file(f"{schemas_folder}/workspace-group-master.json")
+      'schema': schemas['workspace-group-master']
       ,'key_name': 'aad_group_name'
       ,'file_names': _get_team_input_file_paths('workspace-group-master')
       ,'check_key_duplicates': False
     }
     ,'environments': {
-      'schema': load_json_from_file(f"{schemas_folder}/environments.json")
+      'schema': schemas['environments']
       ,'key_name': 'name'
-      ,'file_names': glob.glob(f'{input_folder}/environments.json')
+      ,'file_names': _get_team_input_file_paths('environments', root_only=True)
     }
   }
 
@@ -93,22 +150,81 @@ def print_json_debug(doc: Any) -> None:
   """  
   print(json.dumps(doc, indent=2))
 
-def validate_document_schema(doc:Any, schema:dict) -> Exception:
+_schema_validators: Dict[int, tuple] = {}
+
+def get_schema_validator(schema: dict) -> Any:
+  """gets validator compiled for given schema, the schema is checked against its metaschema and compiled only once per process
+
+  Args:
+      schema (dict): jsonschema object
+
+  Returns:
+      Any: jsonschema validator instance
+  """
+  cached = _schema_validators.get(id(schema))
+  if cached and cached[0] is schema:
+    return cached[1]
+
+  cls = validator_for(schema)
+  cls.check_schema(schema)
+  validator = cls(schema)
+  _schema_validators[id(schema)] = (schema, validator)
+  
+  return validator
+
+def validate_document_schema(doc:Any, schema:dict, collect_errors:bool=False) -> Optional[Exception]:
   """validates document against provided jsonschema
 
   Args:
       doc (Any): document 
       schema (dict): jsonschema object
+      collect_errors (bool): instead of raising the most relevant error, return exception describing all errors found in the document
 
   Returns:
-      Exception: when document does not match the file
+      Optional[Exception]: when `collect_errors` is set and document does not match the schema
   """
   if not schema:
     return None
 
-  validate(instance=doc, schema=schema)
+  validator = get_schema_validator(schema)
+  
+  if not collect_errors:
+    error = best_match(validator.iter_errors(doc))
+    if error is not None:
+      raise error
+    return None
+
+  errors = sorted(validator.iter_errors(doc), key=lambda e: list(e.absolute_path))
+  if errors:
+    return ValueError("\n".join(
+      f"  - at {'/'.join(str(p) for p in e.absolute_path) or '<root>'}: {e.message}"
+      for e in errors
+    ))
+
+def load_and_validate_json_file(file_name: str, schema: dict) -> Tuple[Any, bool]:
+  """loads json file and checks if it matches the schema
+
+  Args:
+      file_name (str): file path
+      schema (dict): schema to validate file with. When set to `None` schema validation will be skipped.
+
+  Returns:
+      Tuple[Any, bool]: loaded document, and flag if document is valid
+  """
+  with open(file_name, 'r') as f:
+    doc = json.load(f)
+
+  return doc, not schema or get_schema_validator(schema).is_valid(doc)
+
+_pool_schemas: Dict[str, dict] = {}
 
-def combine_json_files(file_list: List[str], key_column: str, schema:dict, check_key_duplicates:bool=True) -> List[dict]:
+def _init_pool_worker(schemas: Dict[str, dict]) -> None:
+  _pool_schemas.update(schemas)
+
+def _load_and_validate_pool_file(dataset: str, file_name: str) -> Tuple[Any, bool]:
+  return load_and_validate_json_file(file_name, _pool_schemas[dataset])
+
+def combine_json_files(file_list: List[str], key_column: str, schema:dict, check_key_duplicates:bool=True, collect_errors:bool=False, loaded_files:Optional[List[Future]]=None) -> List[dict]:
   """Combines multiple JSON document into one big document while checking if documents do not have duplicates. Validates the input files to match the schema.
 
   Args:
@@ -116,41 +232,117 @@ def combine_json_files(file_list: List[str], key_column: str, schema:dict, check
       key_column (str): key column in each json document that will be used for validation if documents from various files are not overriding each other
       schema (dict): schema to validate file with. When set to `None` schema validation will be skipped.
       check_key_duplicates (bool): check if duplicateed key_columns are present, and RaiseException
+      collect_errors (bool): validate all files before raising, and report every schema validation error at once
+      loaded_files (Optional[List[Future]]): results of `load_and_validate_json_file(...)` for each file in `file_list` computed by a worker pool. When not set files are loaded in place.
       
   Returns:
       List[Dict]: List of combined JSON documents.
   """  
   data = {}
   key_tracking = {}
+  schema_errors = []
   
-  for file_name in file_list:
+  for file_idx, file_name in enumerate(file_list):
     print(f"- Opening {file_name}...")
-    with open(file_name, 'r') as f:
-      doc = json.load(f)
-      
-      schema_validate_exception = validate_document_schema(doc, schema)
+    doc = None
+    if loaded_files and not loaded_files[file_idx].exception():
+      doc, is_valid = loaded_files[file_idx].result()
+    
+    if doc is None:
+      #load in place, so that errors are raised exactly as in serial mode
+      doc, is_valid = load_and_validate_json_file(file_name, schema)
+    
+    if not is_valid:
+      schema_validate_exception = validate_document_schema(doc, schema, collect_errors)
       if schema_validate_exception:
-        raise ValueError(f'Failed to validate schema of {file_name}') from schema_validate_exception
+        schema_errors.append(f"{file_name}:\n{schema_validate_exception}")
+        continue
+    
+    for idx, entry in enumerate(doc):
+      key = entry.get(key_column)
+      if not key:
+        raise ValueError(f"Undefined key_column={key_column} in file {file_name} record {idx+1}")
       
-      for idx, entry in enumerate(doc):
-        key = entry.get(key_column)
-        if not key:
-          raise ValueError(f"Undefined key_column={key_column} in file {file_name} record {idx+1}")
-        
-        prev_file = key_tracking.get(key)
-        if prev_file and check_key_duplicates:
-          raise ValueError(f"Double defintion of key_column={key_column} in file {file_name} record {idx+1}. Previous definition present in file {prev_file}")
-        
-        key_tracking[key] = f"{file_name} record {idx+1}"
-        data[key] = entry
+      prev_file = key_tracking.get(key)
+      if prev_file and check_key_duplicates:
+        raise ValueError(f"Double defintion of key_column={key_column} in file {file_name} record {idx+1}. Previous definition present in file {prev_file}")
+      
+      key_tracking[key] = f"{file_name} record {idx+1}"
+      data[key] = entry
+  
+  if schema_errors:
+    raise ValueError(f"Failed to validate schema of {len(schema_errors)} file(s):\n" + "\n".join(schema_errors))
     
   return [v for k, v in sorted(data.items())]
 
-def get_combined_datasets(input_file_setup: dict) -> dict:
+def _run_as_future(fn, *args) -> Future:
+  f = Future()
+  try:
+    f.set_result(fn(*args))
+  except Exception as e:
+    f.set_exception(e)
+  
+  return f
+
+def create_input_files_pool(input_file_setups: List[dict], workers: int=1) -> Optional[ProcessPoolExecutor]:
+  """creates process pool for parsing and validation of input files, worker processes get all dataset schemas once on startup
+
+  Args:
+      input_file_setups (List[dict]): list of input structures obtaied from `get_input_files_setup(...)` function
+      workers (int): number of processes (default: 1)
+
+  Returns:
+      Optional[ProcessPoolExecutor]: the pool, or None when pool would not speed up loading (single worker or file)
+  """
+  schemas = {}
+  file_count = 0
+  for input_file_setup in input_file_setups:
+    for dataset, setup in input_file_setup.items():
+      schemas[dataset] = setup['schema']
+      file_count += len(setup['file_names'])
+  
+  if workers <= 1 or file_count <= 1:
+    return None
+  
+  return ProcessPoolExecutor(
+    max_workers=workers
+    ,initializer=_init_pool_worker
+    ,initargs=(schemas,)
+  )
+
+def submit_input_files(input_file_setups: List[dict], executor: Optional[ProcessPoolExecutor]=None) -> Dict[Tuple[str, str], Future]:
+  """parses and validates each distinct input file only once, even if it is used by multiple input structures (i.e. `environments.json` shared by all enviroments)
+
+  Args:
+      input_file_setups (List[dict]): list of input structures obtaied from `get_input_files_setup(...)` function
+      executor (Optional[ProcessPoolExecutor]): pool obtained from `create_input_files_pool(...)` function, when not set files are loaded in place
+
+  Returns:
+      Dict[Tuple[str, str], Future]: dictionary of (dataset, file name) to result of `load_and_validate_json_file(...)`
+  """
+  loaded_files = {}
+  for input_file_setup in input_file_setups:
+    for dataset, setup in input_file_setup.items():
+      for file_name in setup['file_names']:
+        if (dataset, file_name) in loaded_files:
+          continue
+        
+        if executor:
+          loaded_files[(dataset, file_name)] = executor.submit(_load_and_validate_pool_file, dataset, file_name)
+        else:
+          loaded_files[(dataset, file_name)] = _run_as_future(load_and_validate_json_file, file_name, setup['schema'])
+  
+  return loaded_files
+
+def get_combined_datasets(input_file_setup: dict, collect_errors: bool=False, workers: int=1, loaded_files: Optional[Dict[Tuple[str, str], Future]]=None) -> dict:
   """Combines datasets defined in multiple file into one object, validates input files if setup contains validation schema for given dataset.
+  When `workers` is above 1, all files are parsed and validated in parallel by a process pool, and then combined in the same order as in serial mode.
 
   Args:
       input_file_setup (dict): dict containing input structure obtaied from `get_input_files_setup(...)` function
+      collect_errors (bool): report all schema validation errors of a dataset at once, instead of stopping at first one
+      workers (int): number of processes used to parse and validate files (default: 1)
+      loaded_files (Optional[Dict[Tuple[str, str], Future]]): files already submitted by `submit_input_files(...)` function, when set `workers` is ignored
 
   Returns:
       dict: dictionary containing as key the name of the dataset, and as value the combined list of all loaded documentes 
@@ -158,41 +350,455 @@ def get_combined_datasets(input_file_setup: dict) -> dict:
   print_header("Loading defintion files from input directories...")
   print("")
   data = {}
-  for dataset, setup in input_file_setup.items():
-    print(f"Processing dataset {dataset}")
-    combined = combine_json_files(setup['file_names'], setup['key_name'], setup['schema'], setup.get('check_key_duplicates'))
-    data[dataset] = combined
+  executor = None
+  
+  if loaded_files is None:
+    executor = create_input_files_pool([input_file_setup], workers)
+    loaded_files = submit_input_files([input_file_setup], executor) if executor else {}
+  
+  try:
+    for dataset, setup in input_file_setup.items():
+      print(f"Processing dataset {dataset}")
+      dataset_files = [loaded_files[(dataset, f)] for f in setup['file_names']] if loaded_files else None
+      combined = combine_json_files(setup['file_names'], setup['key_name'], setup['schema'], setup.get('check_key_duplicates'), collect_errors, dataset_files)
+      data[dataset] = combined
+  finally:
+    if executor:
+      executor.shutdown(cancel_futures=True)
   
   print("")
   return data
 
-def write_input_tmp_files(combined_datasets: dict, env_name:str, destination_folder: str='.metadata.tmp') -> None:
-  """Writes combined data into destination folder, each dataset defined (a key in input dictionary) is written to a seperate file in destination folder.
+def get_all_env_combined_datasets(env_names: Optional[List[str]]=None, input_folder: str='metadata', schemas_folder: str='metadata.schemas', collect_errors: bool=False, workers: int=1) -> Dict[str, dict]:
+  """Combines datasets of multiple enviroments in one pass: schemas are loaded once, input folder is traversed once, and each input file (including ones shared by enviroments) is parsed and validated once.
+
+  Args:
+      env_names (Optional[List[str]]): names of enviroments to build, all enviroments from environments.json when not set
+      input_folder (str): root folder where enviroment files are stored (defaut: metadata)
+      schemas_folder (str): folder containing schema files (default: metadata.schemas)
+      collect_errors (bool): report all schema validation errors of a dataset at once, instead of stopping at first one
+      workers (int): number of processes used to parse and validate files (default: 1)
+
+  Returns:
+      Dict[str, dict]: dictionary of enviroment name to its combined datasets, as returned by `get_combined_datasets(...)` function
+  """
+  if env_names is None:
+    env_names = list(get_all_enviroments(input_folder))
+  
+  schemas = load_schemas(schemas_folder)
+  input_files = list_input_files(input_folder)
+  input_file_setups = {
+    env_name: get_input_files_setup(env_name, input_folder, schemas=schemas, input_files=input_files)
+    for env_name in env_names
+  }
+  
+  executor = create_input_files_pool(list(input_file_setups.values()), workers)
+  try:
+    loaded_files = submit_input_files(list(input_file_setups.values()), executor)
+    
+    return {
+      env_name: get_combined_datasets(input_file_setup, collect_errors, loaded_files=loaded_files)
+      for env_name, input_file_setup in input_file_setups.items()
+    }
+  finally:
+    if executor:
+      executor.shutdown(cancel_futures=True)
+
+OUTPUT_FORMATS = ['pretty', 'compact']
+
+def iter_json_chunks(doc: Any, output_format: str='pretty') -> Iterator[str]:
+  """serializes json document piece by piece, lists are serialized one record at a time so that whole document is never held as one string
+
+  Args:
+      doc (Any): any valid json serializable object
+      output_format (str): `pretty` (same as `json.dumps(doc, indent=2)`) or `compact` (no whitespace) (default: pretty)
+
+  Yields:
+      Iterator[str]: consecutive parts of serialized document
+  """
+  pretty = output_format == 'pretty'
+  if not isinstance(doc, list) or not doc:
+    yield json.dumps(doc, indent=2) if pretty else json.dumps(doc, separators=(',', ':'))
+    return
+
+  yield '[\n' if pretty else '['
+  for idx, record in enumerate(doc):
+    if pretty:
+      yield ('' if idx == 0 else ',\n') + '  ' + json.dumps(record, indent=2).replace('\n', '\n  ')
+    else:
+      yield ('' if idx == 0 else ',') + json.dumps(record, separators=(',', ':'))
+  yield '\n]' if pretty else ']'
+
+def write_file_if_changed(file_name: str, chunks: Iterable[str]) -> bool:
+  """streams content into temporary file next to the destination, and atomically replaces the destination only when contents differ, 
+  so that interrupted writes never leave partial files and file modification time changes only on real change
+
+  Args:
+      file_name (str): path of the file to write
+      chunks (Iterable[str]): new contents of the file, i.e. obtained from `iter_json_chunks(...)` function
+
+  Returns:
+      bool: True when file was written, False when file already had given contents
+  """
+  if isinstance(chunks, str):
+    chunks = [chunks]
+
+  fd, tmp_file_name = tempfile.mkstemp(dir=os.path.dirname(file_name) or '.', prefix=f'.{os.path.basename(file_name)}.', suffix='.tmp')
+  try:
+    with os.fdopen(fd, 'w') as f:
+      for chunk in chunks:
+        f.write(chunk)
+
+    if os.path.exists(file_name) and filecmp.cmp(tmp_file_name, file_name, shallow=False):
+      os.remove(tmp_file_name)
+      return False
+
+    #mkstemp creates owner only files, use the same permissions as regular open() would
+    umask = os.umask(0)
+    os.umask(umask)
+    os.chmod(tmp_file_name, 0o666 & ~umask)
+    os.replace(tmp_file_name, file_name)
+    return True
+  except BaseException:
+    if os.path.exists(tmp_file_name):
+      os.remove(tmp_file_name)
+    raise
+
+KEYED_FOLDER = 'keyed'
+
+def get_workspace_name(workspace: dict) -> str:
+  """gets workspace name, the last part of its azure resource id
+
+  Args:
+      workspace (dict): record of workspaces dataset
+
+  Returns:
+      str: workspace name
+  """
+  return workspace['workspace_resource_id'].split('/')[-1]
+
+def get_keyed_dataset(dataset: str, records: List[dict], key_name: str) -> Dict[str, dict]:
+  """gets enabled records of dataset keyed by their key, in the form terraform iterates them with `for_each`.
+  Workspaces are keyed by precomputed `workspace_name` instead of their resource id.
+
+  Args:
+      dataset (str): name of the dataset
+      records (List[dict]): combined records of the dataset
+      key_name (str): name of key column of the dataset
+
+  Raises:
+      ValueError: when two enabled records have the same key
+
+  Returns:
+      Dict[str, dict]: key to record
+  """
+  keyed = {}
+  for r in records:
+    if not is_record_enabled(r):
+      continue
+    
+    if dataset == 'workspaces':
+      r = {**r, 'workspace_name': get_workspace_name(r)}
+      key = r['workspace_name']
+    else:
+      key = r[key_name]
+    
+    if key in keyed:
+      raise ValueError(f"Duplicate key {key} of enabled records in dataset {dataset}")
+    keyed[key] = r
+  
+  return keyed
+
+def write_input_tmp_files(combined_datasets: dict, env_name:str, destination_folder: str='.metadata.tmp', output_format: str='pretty', input_file_setup: Optional[dict]=None) -> None:
+  """Writes combined data into destination folder, each dataset defined (a key in input dictionary) is written to a seperate file in destination folder. Files which contents did not change are not rewritten.
 
   Args:
       combined_datasets (dict): the dictionary of combined dataset obtained from `get_combined_datasets(...)` function
       env_name (str): name of the current environment
       destination_folder (str): the destination directory that will be used to create json file per each dataset (default: .metadata.tmp)
+      output_format (str): `pretty` or `compact` json (default: pretty)
+      input_file_setup (Optional[dict]): when set, enabled records of each dataset are also written keyed into `keyed/` subfolder, using key names of this setup obtained from `get_input_files_setup(...)` function
   """  
   print_header(f"Writing files into {destination_folder}/ directory...")
   print("")
   os.makedirs(destination_folder, exist_ok=True)
+  if input_file_setup is not None:
+    os.makedirs(f'{destination_folder}/{KEYED_FOLDER}', exist_ok=True)
   
-  current_environment = [
-    e
-    for e in combined_datasets['environments']
-    if e['name'] == env_name
-  ][0]
+  if 'environments' in combined_datasets:
+    current_environment = [
+      e
+      for e in combined_datasets['environments']
+      if e['name'] == env_name
+    ][0]
   
-  with open(f'{destination_folder}/current_environment.json', 'w') as f:
-    f.write(json.dumps(current_environment, indent=2))
+    write_file_if_changed(f'{destination_folder}/current_environment.json', iter_json_chunks(current_environment, output_format))
       
   for dataset, data in combined_datasets.items():
     output_file_name = f'{destination_folder}/{dataset}.json'
+    if write_file_if_changed(output_file_name, iter_json_chunks(data, output_format)):
+      print(f"- Creating file {output_file_name}")
+    else:
+      print(f"- Unchanged file {output_file_name}")
+    
+    if input_file_setup is not None and dataset in input_file_setup:
+      keyed_file_name = f'{destination_folder}/{KEYED_FOLDER}/{dataset}.json'
+      keyed_data = get_keyed_dataset(dataset, data, input_file_setup[dataset]['key_name'])
+      if write_file_if_changed(keyed_file_name, iter_json_chunks(keyed_data, output_format)):
+        print(f"- Creating file {keyed_file_name}")
+      else:
+        print(f"- Unchanged file {keyed_file_name}")
+
+WORKSPACE_CONFIG_DATASETS = ['workspaces', 'workspace-group-master']
+
+def get_workspace_configs(combined_datasets: dict) -> Dict[str, dict]:
+  """precomputes configuration of each enabled workspace, so workspace module gets it as plain inputs instead of decoding whole datasets per workspace
+
+  Args:
+      combined_datasets (dict): the dictionary of combined datasets, containing at least `workspaces` and `workspace-group-master`
+
+  Returns:
+      Dict[str, dict]: workspace name to its workspace_id, role_admin, default_catalog_name and aad_group_names
+  """
+  master_groups = {
+    g['aad_group_name']
+    for g in combined_datasets['workspace-group-master']
+    if is_record_enabled(g)
+  }
+  
+  return {
+    get_workspace_name(w): {
+      'workspace_id': w['workspace_id']
+      ,'role_admin': w['role_admin']
+      ,'default_catalog_name': w.get('default_catalog_name', 'hive_metastore')
+      ,'aad_group_names': sorted(master_groups.union(w.get('account_groups', [])))
+    }
+    for w in combined_datasets['workspaces']
+    if is_record_enabled(w)
+  }
+
+def write_workspace_configs(combined_datasets: dict, destination_folder: str='.metadata.tmp', output_format: str='pretty') -> None:
+  """Writes precomputed workspace configurations into workspace-configs.json in destination folder, when its contents changed
+
+  Args:
+      combined_datasets (dict): the dictionary of combined datasets, containing at least `workspaces` and `workspace-group-master`
+      destination_folder (str): the destination directory of the build (default: .metadata.tmp)
+      output_format (str): `pretty` or `compact` json (default: pretty)
+  """
+  output_file_name = f'{destination_folder}/workspace-configs.json'
+  if write_file_if_changed(output_file_name, iter_json_chunks(get_workspace_configs(combined_datasets), output_format)):
     print(f"- Creating file {output_file_name}")
-    with open(output_file_name, 'w') as f:
-      f.write(json.dumps(data, indent=2))
+  else:
+    print(f"- Unchanged file {output_file_name}")
+
+def get_file_sha256(file_path: str) -> str:
+  """gets sha256 of file contents
+
+  Args:
+      file_path (str): file path
+
+  Returns:
+      str: hex digest of file contents
+  """
+  h = hashlib.sha256()
+  with open(file_path, 'rb') as f:
+    for chunk in iter(lambda: f.read(1024 * 1024), b''):
+      h.update(chunk)
+
+  return h.hexdigest()
+
+def get_datasets_manifest(input_file_setup: dict, env_name: str, previous_manifest: Optional[dict]=None, output_format: str='pretty') -> dict:
+  """builds manifest describing inputs of each dataset: schema and key setup, and path, mtime, size and content hash of each input file. 
+  Content hash is taken from previous manifest when file mtime and size did not change.
+
+  Args:
+      input_file_setup (dict): dict containing input structure obtaied from `get_input_files_setup(...)` function
+      env_name (str): name of the current environment
+      previous_manifest (Optional[dict]): manifest of previous build obtained from `load_manifest(...)` function
+      output_format (str): format of output files (default: pretty)
+
+  Returns:
+      dict: manifest document
+  """
+  previous_datasets = (previous_manifest or {}).get('datasets', {})
+  datasets = {}
+  
+  for dataset, setup in input_file_setup.items():
+    previous_files = previous_datasets.get(dataset, {}).get('files', {})
+    setup_doc = {k: v for k, v in setup.items() if k != 'file_names'}
+    files = {}
+    
+    for file_name in setup['file_names']:
+      stat = os.stat(file_name)
+      prev = previous_files.get(file_name)
+      if prev and prev['mtime'] == stat.st_mtime and prev['size'] == stat.st_size:
+        sha256 = prev['sha256']
+      else:
+        sha256 = get_file_sha256(file_name)
+      
+      files[file_name] = {'mtime': stat.st_mtime, 'size': stat.st_size, 'sha256': sha256}
+    
+    datasets[dataset] = {
+      'setup_sha256': hashlib.sha256(json.dumps(setup_doc, sort_keys=True).encode('utf-8')).hexdigest()
+      ,'files': files
+    }
+  
+  return {
+    'env_name': env_name
+    ,'output_format': output_format
+    ,'datasets': datasets
+  }
+
+def get_changed_datasets(manifest: dict, previous_manifest: Optional[dict], destination_folder: str='.metadata.tmp') -> List[str]:
+  """gets names of datasets that need to be rebuild, because their inputs, schema, environment or output format changed or their output file is missing
+
+  Args:
+      manifest (dict): manifest of current inputs obtained from `get_datasets_manifest(...)` function
+      previous_manifest (Optional[dict]): manifest of previous build obtained from `load_manifest(...)` function
+      destination_folder (str): the destination directory of the build (default: .metadata.tmp)
+
+  Returns:
+      List[str]: names of datasets to rebuild
+  """
+  if not previous_manifest \
+    or previous_manifest.get('env_name') != manifest['env_name'] \
+    or previous_manifest.get('output_format') != manifest['output_format']:
+    return list(manifest['datasets'])
+
+  def _fingerprint(d):
+    return (d['setup_sha256'], {f: v['sha256'] for f, v in d['files'].items()})
+
+  changed = []
+  for dataset, current in manifest['datasets'].items():
+    previous = previous_manifest['datasets'].get(dataset)
+    if not previous \
+      or _fingerprint(previous) != _fingerprint(current) \
+      or not os.path.exists(f'{destination_folder}/{dataset}.json') \
+      or not os.path.exists(f'{destination_folder}/{KEYED_FOLDER}/{dataset}.json'):
+      changed.append(dataset)
+  
+  # current_environment.json is written only together with environments dataset
+  if 'environments' in manifest['datasets'] and 'environments' not in changed \
+    and not os.path.exists(f'{destination_folder}/current_environment.json'):
+    changed.append('environments')
+  
+  return changed
+
+def load_manifest(destination_folder: str='.metadata.tmp') -> Optional[dict]:
+  """loads manifest of previous build
+
+  Args:
+      destination_folder (str): the destination directory of the build (default: .metadata.tmp)
+
+  Returns:
+      Optional[dict]: manifest document, None if there was no previous build
+  """
+  try:
+    return load_json_from_file(f'{destination_folder}/.manifest.json')
+  except (OSError, ValueError):
+    return None
+
+def save_manifest(manifest: dict, destination_folder: str='.metadata.tmp') -> None:
+  """saves manifest of current build
+
+  Args:
+      manifest (dict): manifest obtained from `get_datasets_manifest(...)` function
+      destination_folder (str): the destination directory of the build (default: .metadata.tmp)
+  """
+  os.makedirs(destination_folder, exist_ok=True)
+  write_file_if_changed(f'{destination_folder}/.manifest.json', iter_json_chunks(manifest))
+      
+DATASET_REFERENCES = [
+  {'dataset': 'catalogs', 'column': 'storage_location_name', 'references': 'storage-locations'}
+  ,{'dataset': 'storage-locations', 'column': 'storage_credential_name', 'references': 'storage-credentials'}
+  ,{'dataset': 'workspaces', 'column': 'default_catalog_name', 'references': 'catalogs', 'external_keys': ['hive_metastore']}
+]
+
+def is_record_enabled(record: dict) -> bool:
+  """checks if record is enabled, records without `enabled` attribute are always enabled
+
+  Args:
+      record (dict): dataset record
+
+  Returns:
+      bool: True when record is enabled
+  """
+  return bool(record.get('enabled', True))
+
+def get_dataset_reference_errors(combined_datasets: dict, input_file_setup: dict) -> List[str]:
+  """finds all references between datasets pointing to missing or disabled records, using hash index over key of each dataset
+
+  Args:
+      combined_datasets (dict): the dictionary of all combined datasets of the environment
+      input_file_setup (dict): dict containing input structure obtaied from `get_input_files_setup(...)` function, used to get key name of each dataset
+
+  Returns:
+      List[str]: description of each dangling reference, empty when all references are valid
+  """
+  key_index = {
+    dataset: {r.get(input_file_setup[dataset]['key_name']): r for r in records}
+    for dataset, records in combined_datasets.items()
+    if dataset in input_file_setup
+  }
+  errors = []
+  
+  for ref in DATASET_REFERENCES:
+    key_name = input_file_setup[ref['dataset']]['key_name']
+    targets = key_index.get(ref['references'], {})
+    
+    for record in combined_datasets.get(ref['dataset'], []):
+      value = record.get(ref['column'])
+      if not is_record_enabled(record) or value is None or value in ref.get('external_keys', []):
+        continue
       
+      target = targets.get(value)
+      if target is None:
+        errors.append(f"{ref['dataset']} {key_name}={record[key_name]}: {ref['column']}={value} is not defined in {ref['references']}")
+      elif not is_record_enabled(target):
+        errors.append(f"{ref['dataset']} {key_name}={record[key_name]}: {ref['column']}={value} is disabled in {ref['references']}")
+  
+  master_groups = {
+    g['aad_group_name']
+    for g in combined_datasets.get('workspace-group-master', [])
+    if is_record_enabled(g)
+  }
+  for w in combined_datasets.get('workspaces', []):
+    if is_record_enabled(w) and w['role_admin'] not in master_groups.union(w.get('account_groups', [])):
+      errors.append(f"workspaces workspace_resource_id={w['workspace_resource_id']}: role_admin={w['role_admin']} is neither in account_groups nor in workspace-group-master")
+  
+  return errors
+
+def validate_dataset_references(combined_datasets: dict, input_file_setup: dict) -> None:
+  """validates references between datasets, reporting every dangling reference at once
+
+  Args:
+      combined_datasets (dict): the dictionary of all combined datasets of the environment
+      input_file_setup (dict): dict containing input structure obtaied from `get_input_files_setup(...)` function
+
+  Raises:
+      ValueError: when any reference is dangling
+  """
+  print_header("Validating references between datasets...")
+  print("")
+  errors = get_dataset_reference_errors(combined_datasets, input_file_setup)
+  if errors:
+    raise ValueError(f"{len(errors)} dangling reference(s) found:\n" + "\n".join(f"- {e}" for e in errors))
+
+def load_tmp_datasets(datasets: List[str], destination_folder: str='.metadata.tmp') -> dict:
+  """loads previously written datasets from destination folder
+
+  Args:
+      datasets (List[str]): names of datasets to load
+      destination_folder (str): the destination directory of the build (default: .metadata.tmp)
+
+  Returns:
+      dict: dictionary of dataset name to its combined records
+  """
+  return {
+    dataset: load_json_from_file(f'{destination_folder}/{dataset}.json')
+    for dataset in datasets
+  }
+
 def validate_environment_name(env_name: str, input_folder:str='metadata') -> Union[bool, Exception]:
   """validates if environment name is defined in environments.json
 
@@ -229,19 +835,16 @@ def get_all_enviroments(input_folder:str='metadata') -> dict:
       
   return data
 
-def get_env_aad_groups(env_name:str, input_folder:str='metadata') -> list:
-  """gets all aad groups for given enviroment setup
+def get_datasets_aad_groups(combined_datasets: dict) -> list:
+  """gets all aad groups referenced by combined datasets of single enviroment
 
   Args:
-      env_name (str): name of the enironment
-      input_folder (str, optional): the name of the folder where environments.json is stored (default: inputs)
+      combined_datasets (dict): the dictionary of combined dataset obtained from `get_combined_datasets(...)` function
 
   Returns:
       list: unique list of all aad groups, sortect alphabetically
-  """  
+  """
   groups = set()
-  input_file_setup = get_input_files_setup(env_name, input_folder)
-  combined_datasets = get_combined_datasets(input_file_setup)
   
   for w in combined_datasets['workspaces']:
     g = w.get('account_groups', [])
@@ -251,16 +854,76 @@ def get_env_aad_groups(env_name:str, input_folder:str='metadata') -> list:
     groups.add(g['aad_group_name'])
     
   return sorted(list(groups))
+
+def get_env_aad_groups(env_name:str, input_folder:str='metadata') -> list:
+  """gets all aad groups for given enviroment setup
+
+  Args:
+      env_name (str): name of the enironment
+      input_folder (str, optional): the name of the folder where environments.json is stored (default: inputs)
+
+  Returns:
+      list: unique list of all aad groups, sortect alphabetically
+  """  
+  input_file_setup = get_input_files_setup(env_name, input_folder)
+  combined_datasets = get_combined_datasets(input_file_setup)
+  
+  return get_datasets_aad_groups(combined_datasets)
+
+def get_all_env_aad_groups(input_folder:str='metadata', workers:int=1) -> Dict[str, list]:
+  """gets all aad groups of each enviroment, building all enviroments in one pass
+
+  Args:
+      input_folder (str, optional): the name of the folder where environments.json is stored (default: metadata)
+      workers (int): number of processes used to parse and validate files (default: 1)
+
+  Returns:
+      Dict[str, list]: dictionary of enviroment name to unique list of its aad groups, sorted alphabetically
+  """
+  return {
+    env_name: get_datasets_aad_groups(combined_datasets)
+    for env_name, combined_datasets in get_all_env_combined_datasets(input_folder=input_folder, workers=workers).items()
+  }
     
 if __name__ == "__main__":
   arg_parser = argparse.ArgumentParser()
   arg_parser.add_argument("env_name")
+  arg_parser.add_argument("--incremental", action="store_true", help="rebuild only datasets which input files or schema changed since previous build")
+  arg_parser.add_argument("--all-errors", action="store_true", help="report every schema validation error of a dataset instead of stopping at the first one")
+  arg_parser.add_argument("--workers", type=int, default=os.cpu_count(), help="number of processes used to parse and validate input files (default: number of cpus)")
+  arg_parser.add_argument("--output-format", choices=OUTPUT_FORMATS, default="pretty", help="pretty (indented) or compact json output files (default: pretty)")
   args = arg_parser.parse_args()
 
   validate_environment_name(args.env_name)
 
   input_file_setup = get_input_files_setup(args.env_name)
 
-  combined_datasets = get_combined_datasets(input_file_setup)
+  previous_manifest = load_manifest()
+  manifest = get_datasets_manifest(input_file_setup, args.env_name, previous_manifest, args.output_format)
+  
+  build_file_setup = input_file_setup
+  if args.incremental:
+    changed_datasets = get_changed_datasets(manifest, previous_manifest)
+    print(f"Incremental build, datasets to rebuild: {changed_datasets}")
+    build_file_setup = {
+      dataset: setup
+      for dataset, setup in input_file_setup.items()
+      if dataset in changed_datasets
+    }
+
+  combined_datasets = get_combined_datasets(build_file_setup, args.all_errors, args.workers)
 
-  write_input_tmp_files(combined_datasets, args.env_name)
\ No newline at end of file
+  if combined_datasets:
+    unchanged_datasets = load_tmp_datasets([d for d in input_file_setup if d not in combined_datasets])
+    validate_dataset_references({**unchanged_datasets, **combined_datasets}, input_file_setup)
+
+  write_input_tmp_files(combined_datasets, args.env_name, output_format=args.output_format, input_file_setup=input_file_setup)
+  
+  if any(d in combined_datasets for d in WORKSPACE_CONFIG_DATASETS) or not os.path.exists('.metadata.tmp/workspace-configs.json'):
+    workspace_datasets = {
+      **load_tmp_datasets([d for d in WORKSPACE_CONFIG_DATASETS if d not in combined_datasets])
+      ,**combined_datasets
+    }
+    write_workspace_configs(workspace_datasets, output_format=args.output_format)
+  
+  save_manifest(manifest)
\ No newline at end of file
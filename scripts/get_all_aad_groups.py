@@ -1,3 +1,4 @@
+import os
 import json
 import argparse
 import build_metadata_tmp as BMT
@@ -5,12 +6,13 @@ import build_metadata_tmp as BMT
 if __name__ == "__main__":
   arg_parser = argparse.ArgumentParser()
   arg_parser.add_argument("output", help="output.json file name to write groups to")
+  arg_parser.add_argument("--workers", type=int, default=os.cpu_count(), help="number of processes used to parse and validate input files (default: number of cpus)")
   args = arg_parser.parse_args()
 
   groups = set()
 
-  for env_name in BMT.get_all_enviroments():
-    groups.update(BMT.get_env_aad_groups(env_name))
+  for env_groups in BMT.get_all_env_aad_groups(workers=args.workers).values():
+    groups.update(env_groups)
     
   with open(args.output, "w") as f:
     f.write(json.dumps(list(groups), indent=2))
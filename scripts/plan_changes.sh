@@ -1,5 +1,8 @@
 #!/bin/sh
+# PLAN_SCOPE=changes plans only resources of metadata changed since last apply (see scripts/plan_scope.py)
+set -f
 sh scripts/pre_tf.sh $1 && 
-  terraform plan -out tfplan $2 $3 $4 &&
+  (if [ "$PLAN_SCOPE" = "changes" ]; then python scripts/plan_scope.py targets $1; fi) > tfplan.targets &&
+  terraform plan -out tfplan `cat tfplan.targets` $2 $3 $4 &&
   terraform show -json tfplan > tfplan.json &&
-  python scripts/validate_plan.py $1 tfplan.json
\ No newline at end of file
+  python scripts/validate_plan.py $1 tfplan.json
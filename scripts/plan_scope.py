@@ -0,0 +1,200 @@
+import os
+import sys
+import shutil
+import hashlib
+import argparse
+from typing import List, Dict, Optional, Set
+import build_metadata_tmp as BMT
+import tf_init_fingerprint as TIF
+
+APPLIED_FOLDER = '.metadata.applied'
+
+# datasets affecting every resource of the environment, any change to them needs a full plan
+GLOBAL_DATASETS = ['metastores', 'workspace-group-master', 'environments']
+
+# datasets with per-record terraform addresses, key_name matches `get_input_files_setup(...)`
+SCOPED_DATASETS = {
+  'catalogs': {
+    'key_name': 'name'
+    ,'addresses': ['databricks_catalog.catalog["{key}"]', 'module.catalog_grants["{key}"]']
+  }
+  ,'storage-locations': {
+    'key_name': 'name'
+    ,'addresses': ['databricks_external_location.storage_location["{key}"]', 'module.storage_location_grants["{key}"]']
+    ,'dependents': [{'dataset': 'catalogs', 'column': 'storage_location_name'}]
+  }
+  ,'storage-credentials': {
+    'key_name': 'name'
+    ,'addresses': ['databricks_storage_credential.storage_credential["{key}"]']
+    ,'dependents': [{'dataset': 'storage-locations', 'column': 'storage_credential_name'}]
+  }
+  ,'workspaces': {
+    'key_name': 'workspace_resource_id'
+    ,'addresses': ['module.dbr_workspace["{workspace_name}"]']
+  }
+}
+
+def get_tf_files_sha256() -> str:
+  """gets combined sha256 of all terraform files, lock file and generated providers, used to detect code changes since last apply
+
+  Returns:
+      str: hex digest
+  """
+  h = hashlib.sha256()
+  for file_name in TIF.get_init_files():
+    if os.path.exists(file_name):
+      h.update(f"{file_name}:{BMT.get_file_sha256(file_name)}\n".encode())
+
+  return h.hexdigest()
+
+def load_datasets(folder: str, datasets: List[str]) -> Optional[dict]:
+  """loads datasets from folder, None when any of them is missing
+
+  Args:
+      folder (str): folder with dataset json files
+      datasets (List[str]): names of datasets to load
+
+  Returns:
+      Optional[dict]: dictionary of dataset name to its records
+  """
+  try:
+    return BMT.load_tmp_datasets(datasets, folder)
+  except FileNotFoundError:
+    return None
+
+def get_enabled_records_index(records: List[dict], key_name: str) -> Dict[str, dict]:
+  return {
+    r[key_name]: r
+    for r in records
+    if BMT.is_record_enabled(r)
+  }
+
+def get_changed_keys(previous: List[dict], current: List[dict], key_name: str) -> Set[str]:
+  """gets keys of enabled records which were added, removed (or disabled) or modified between two builds of dataset
+
+  Args:
+      previous (List[dict]): records of previously applied build
+      current (List[dict]): records of current build
+      key_name (str): name of key column of dataset
+
+  Returns:
+      Set[str]: changed keys
+  """
+  previous_index = get_enabled_records_index(previous, key_name)
+  current_index = get_enabled_records_index(current, key_name)
+
+  return {
+    key
+    for key in previous_index.keys() | current_index.keys()
+    if previous_index.get(key) != current_index.get(key)
+  }
+
+def get_plan_targets(previous: dict, current: dict) -> List[str]:
+  """maps changed records of scoped datasets to terraform addresses, including records depending on changed ones
+
+  Args:
+      previous (dict): datasets of previously applied build
+      current (dict): datasets of current build
+
+  Returns:
+      List[str]: sorted terraform addresses to target
+  """
+  changed = {
+    dataset: get_changed_keys(previous[dataset], current[dataset], setup['key_name'])
+    for dataset, setup in SCOPED_DATASETS.items()
+  }
+
+  # credentials -> locations -> catalogs, records of both builds are checked so removed references are included as well
+  for dataset in ['storage-credentials', 'storage-locations']:
+    for dependent in SCOPED_DATASETS[dataset].get('dependents', []):
+      key_name = SCOPED_DATASETS[dependent['dataset']]['key_name']
+      for records in (previous[dependent['dataset']], current[dependent['dataset']]):
+        changed[dependent['dataset']].update(
+          r[key_name]
+          for r in records
+          if BMT.is_record_enabled(r) and r.get(dependent['column']) in changed[dataset]
+        )
+
+  targets = set()
+  for dataset, keys in changed.items():
+    for key in keys:
+      for address in SCOPED_DATASETS[dataset]['addresses']:
+        targets.add(address.format(key=key, workspace_name=key.split('/')[-1]))
+
+  return sorted(targets)
+
+def get_full_plan_reason(env_name: str, previous: Optional[dict], current: dict, applied_folder: str) -> Optional[str]:
+  """checks if scoped plan is not safe, returns the reason why full plan is needed
+
+  Args:
+      env_name (str): name of the environment
+      previous (Optional[dict]): datasets of previously applied build, None if there is no snapshot
+      current (dict): datasets of current build
+      applied_folder (str): folder with snapshot of previously applied build
+
+  Returns:
+      Optional[str]: reason for full plan, None when scoped plan can be used
+  """
+  if previous is None:
+    return f"no snapshot of previously applied metadata in {applied_folder}/{env_name}"
+
+  try:
+    with open(f"{applied_folder}/{env_name}/.tf-files.sha256") as f:
+      if f.read().strip() != get_tf_files_sha256():
+        return "terraform files changed since last apply"
+  except FileNotFoundError:
+    return "no fingerprint of terraform files of last apply"
+
+  changed_global = [d for d in GLOBAL_DATASETS if previous[d] != current[d]]
+  if changed_global:
+    return f"global datasets changed: {changed_global}"
+
+  return None
+
+def save_applied_snapshot(env_name: str, datasets: List[str], tmp_folder: str='.metadata.tmp', applied_folder: str=APPLIED_FOLDER) -> None:
+  """copies datasets of applied build and fingerprint of terraform files into snapshot folder of the environment
+
+  Args:
+      env_name (str): name of the environment
+      datasets (List[str]): names of datasets to copy
+      tmp_folder (str): folder with current build (default: .metadata.tmp)
+      applied_folder (str): root folder of snapshots (default: .metadata.applied)
+  """
+  destination = f"{applied_folder}/{env_name}"
+  os.makedirs(destination, exist_ok=True)
+
+  for dataset in datasets:
+    shutil.copyfile(f"{tmp_folder}/{dataset}.json", f"{destination}/{dataset}.json")
+
+  with open(f"{destination}/.tf-files.sha256", "w") as f:
+    f.write(get_tf_files_sha256())
+
+if __name__ == "__main__":
+  arg_parser = argparse.ArgumentParser(description="Computes -target arguments of scoped terraform plan from metadata changes since last apply, or saves snapshot of applied metadata")
+  arg_parser.add_argument("action", choices=['targets', 'snapshot'], help="targets: print -target arguments (nothing when full plan is needed), snapshot: save current build as applied")
+  arg_parser.add_argument("env_name")
+  args = arg_parser.parse_args()
+
+  datasets = list(SCOPED_DATASETS) + GLOBAL_DATASETS
+
+  if args.action == 'snapshot':
+    save_applied_snapshot(args.env_name, datasets)
+    sys.exit(0)
+
+  current = BMT.load_tmp_datasets(datasets)
+  previous = load_datasets(f"{APPLIED_FOLDER}/{args.env_name}", datasets)
+
+  # diagnostics go to stderr, stdout holds only terraform arguments
+  reason = get_full_plan_reason(args.env_name, previous, current, APPLIED_FOLDER)
+  if reason:
+    print(f"Full plan: {reason}", file=sys.stderr)
+    sys.exit(0)
+
+  targets = get_plan_targets(previous, current)
+  if not targets:
+    print("Full plan: no metadata changes since last apply", file=sys.stderr)
+    sys.exit(0)
+
+  print(f"Scoped plan: {len(targets)} target(s)", file=sys.stderr)
+  for t in targets:
+    print(f"-target={t}")
@@ -1,15 +1,25 @@
 #!/bin/sh
-python scripts/build_metadata_tmp.py $1 &&
+export TF_PLUGIN_CACHE_DIR="${TF_PLUGIN_CACHE_DIR:-$HOME/.terraform.d/plugin-cache}"
+mkdir -p "$TF_PLUGIN_CACHE_DIR" &&
+python scripts/build_metadata_tmp.py $1 --incremental &&
 python scripts/build_dynamic_providers.py $1 &&
 python scripts/build_dynamic_imports.py &&
+python scripts/build_account_groups.py &&
 (
-  if [ "`cat .terraform/environment 2> /dev/null`" == "$1" ]; then 
-    echo "Already cached .terraform env is correct!"
-  else 
-    echo "Change of env detected! Cleaning up cached .terraform folder!" && rm -rf .terraform 2> /dev/null 
+  if python scripts/tf_init_fingerprint.py check $1; then
+    echo "Terraform init inputs and workspace unchanged, skipping terraform init!"
+  else
+    if [ "`cat .terraform/environment 2> /dev/null`" = "$1" ]; then
+      echo "Already cached .terraform env is correct!" &&
+      terraform init -upgrade -migrate-state
+    else
+      # Backend key differs per env, providers are kept in .terraform and shared plugin cache
+      # Workspace of previous env does not exist under new backend key, it is selected after init
+      echo "Change of env detected! Reconfiguring backend of cached .terraform folder!" &&
+      rm -f .terraform/environment &&
+      terraform init -upgrade -reconfigure
+    fi &&
+    terraform workspace select -or-create $1 &&
+    python scripts/tf_init_fingerprint.py save $1
   fi
-) &&
-terraform init -upgrade -migrate-state &&
-terraform workspace select -or-create $1 &&
-terraform init -upgrade
-  
\ No newline at end of file
+)
@@ -0,0 +1,240 @@
+import os
+import sys
+import json
+import argparse
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict
+import build_dynamic_providers as BDP
+
+def get_shard_waves(shards: Dict[str, dict]) -> List[List[str]]:
+  """orders shards into waves, every shard runs after all shards it depends on, shards of one wave run in parallel
+
+  Args:
+      shards (Dict[str, dict]): shard definitions with `depends_on` list
+
+  Raises:
+      ValueError: when dependencies between shards are cyclic
+
+  Returns:
+      List[List[str]]: names of shards of each wave
+  """
+  done = set()
+  waves = []
+  while len(done) < len(shards):
+    wave = sorted(
+      shard
+      for shard, setup in shards.items()
+      if shard not in done and set(setup['depends_on']) <= done
+    )
+    if not wave:
+      raise ValueError(f"Cyclic dependencies between shards: {sorted(set(shards) - done)}")
+
+    waves.append(wave)
+    done.update(wave)
+
+  return waves
+
+def run_logged(commands: List[List[str]], shard: str, folder: str, log_file: str) -> bool:
+  """runs commands one after another in shard folder (except python scripts, which run from repository root), output is written into log file
+
+  Args:
+      commands (List[List[str]]): commands to run
+      shard (str): name of the shard
+      folder (str): terraform root folder of the shard
+      log_file (str): path of the log file
+
+  Returns:
+      bool: True when all commands succeeded
+  """
+  with open(log_file, 'w') as log:
+    for command in commands:
+      log.write(f"$ {' '.join(command)}\n")
+      log.flush()
+      cwd = None if command[0] == sys.executable else folder
+      if subprocess.run(command, cwd=cwd, stdout=log, stderr=subprocess.STDOUT).returncode != 0:
+        print(f"- Shard {shard} failed at: {' '.join(command)}, see {log_file}")
+        return False
+
+  return True
+
+def init_shard(env_name: str, shard: str, folder: str) -> bool:
+  """runs terraform init and workspace selection of single shard, skipped when init inputs and workspace did not change since last init
+
+  Args:
+      env_name (str): name of the environment / terraform workspace
+      shard (str): name of the shard
+      folder (str): terraform root folder of the shard
+
+  Returns:
+      bool: True when shard is initialized
+  """
+  fingerprint = os.path.abspath('scripts/tf_init_fingerprint.py')
+  # fingerprint script reads terraform files relative to its working directory, so it's run in shard folder
+  if subprocess.run([sys.executable, fingerprint, 'check', env_name], cwd=folder).returncode == 0:
+    print(f"- Shard {shard} init inputs and workspace unchanged, skipping terraform init")
+    return True
+
+  commands = [
+    ['terraform', 'init', '-input=false', '-upgrade'],
+    ['terraform', 'workspace', 'select', '-or-create', env_name],
+  ]
+  if not run_logged(commands, shard, folder, f"{folder}/init.log"):
+    return False
+
+  subprocess.run([sys.executable, fingerprint, 'save', env_name], cwd=folder, check=True)
+
+  print(f"- Shard {shard} init succeeded")
+  return True
+
+def get_delete_addresses(tfplan_json: str) -> List[str]:
+  """gets addresses of resources which the plan only deletes (replacements are not included)
+
+  Args:
+      tfplan_json (str): path of plan in json format
+
+  Returns:
+      List[str]: terraform addresses
+  """
+  with open(tfplan_json) as f:
+    resource_changes = json.load(f).get('resource_changes', [])
+
+  return [
+    rc['address']
+    for rc in resource_changes
+    if rc['change']['actions'] == ['delete']
+  ]
+
+def apply_shard_deletes(env_name: str, shard: str, folder: str) -> bool:
+  """applies only deletes of single initialized shard, so that resources of dependent shards are removed before core resources they use.
+  When the shard cannot be planned yet (i.e. it references core resources created later in the same run), its deletes are left for the main apply.
+
+  Args:
+      env_name (str): name of the environment / terraform workspace
+      shard (str): name of the shard
+      folder (str): terraform root folder of the shard
+
+  Returns:
+      bool: True when deletes were applied or there was nothing to delete
+  """
+  commands = [
+    ['terraform', 'plan', '-input=false', '-out', 'tfplan'],
+    ['sh', '-c', 'terraform show -json tfplan > tfplan.json'],
+  ]
+  if not run_logged(commands, shard, folder, f"{folder}/plan-deletes.log"):
+    print(f"- Shard {shard} deletes not applied ahead, they stay in its main apply")
+    return True
+
+  addresses = get_delete_addresses(f"{folder}/tfplan.json")
+  if not addresses:
+    return True
+
+  # targeting resources which are no longer in configuration plans only their deletes
+  commands = [
+    ['terraform', 'plan', '-input=false', '-out', 'tfplan'] + [f"-target={a}" for a in addresses],
+    ['sh', '-c', 'terraform show -json tfplan > tfplan.json'],
+    [sys.executable, os.path.abspath('scripts/validate_plan.py'), env_name, os.path.abspath(f'{folder}/tfplan.json')],
+    ['terraform', 'apply', '-input=false', 'tfplan'],
+  ]
+  log_file = f"{folder}/apply-deletes.log"
+  if not run_logged(commands, shard, folder, log_file):
+    return False
+
+  print(f"- Shard {shard} deleted {len(addresses)} resource(s), see {log_file}")
+  return True
+
+def run_shard(env_name: str, shard: str, folder: str, action: str) -> bool:
+  """runs terraform plan and (for apply action) plan validation and apply of single initialized shard, output is written into log file in shard folder.
+  Plans of plan action are validated together after all shards are planned (see `validate_shard_plans(...)`), so deletes spread over shards are seen at once.
+
+  Args:
+      env_name (str): name of the environment / terraform workspace
+      shard (str): name of the shard
+      folder (str): terraform root folder of the shard
+      action (str): `plan` or `apply`
+
+  Returns:
+      bool: True when all steps succeeded
+  """
+  commands = [
+    ['terraform', 'plan', '-input=false', '-out', 'tfplan'],
+    ['sh', '-c', 'terraform show -json tfplan > tfplan.json'],
+  ]
+  if action == 'apply':
+    commands += [
+      # plan validator reads environment setup from repository root
+      [sys.executable, os.path.abspath('scripts/validate_plan.py'), env_name, os.path.abspath(f'{folder}/tfplan.json')],
+      ['terraform', 'apply', '-input=false', 'tfplan'],
+    ]
+
+  log_file = f"{folder}/{action}.log"
+  if not run_logged(commands, shard, folder, log_file):
+    return False
+
+  print(f"- Shard {shard} {action} succeeded, see {log_file}")
+  return True
+
+def validate_shard_plans(env_name: str, folders: List[str]) -> bool:
+  """validates plans of given shards in one run of plan validator, so that i.e. delete of a catalog planned in one shard
+  allows delete of its external location planned in another one
+
+  Args:
+      env_name (str): name of the environment / terraform workspace
+      folders (List[str]): terraform root folders of planned shards
+
+  Returns:
+      bool: True when no issues were found
+  """
+  command = [sys.executable, 'scripts/validate_plan.py', env_name] + [f"{folder}/tfplan.json" for folder in folders]
+  return subprocess.run(command).returncode == 0
+
+if __name__ == "__main__":
+  arg_parser = argparse.ArgumentParser(description="Plans or applies sharded terraform layout, shards without dependencies between them run in parallel")
+  arg_parser.add_argument("env_name")
+  arg_parser.add_argument("action", choices=['plan', 'apply'])
+  args = arg_parser.parse_args()
+
+  env = BDP.load_current_environment(args.env_name)
+  shard_folders = BDP.write_shards(env)
+
+  # providers are downloaded once into shared cache (as in pre_tf.sh), shards are initialized one at a time,
+  # because parallel inits writing into the same plugin cache are not safe
+  os.environ.setdefault('TF_PLUGIN_CACHE_DIR', os.path.expanduser('~/.terraform.d/plugin-cache'))
+  os.makedirs(os.environ['TF_PLUGIN_CACHE_DIR'], exist_ok=True)
+  for shard in BDP.SHARDS:
+    if not init_shard(args.env_name, shard, shard_folders[shard]):
+      raise SystemExit(f"Shard {shard} init failed")
+
+  waves = get_shard_waves(BDP.SHARDS)
+
+  # core resources can be deleted only when nothing uses them anymore, so deletes run first, dependent shards before their dependencies
+  if args.action == 'apply':
+    for wave in reversed(waves):
+      print(f"Applying deletes of shards: {wave}")
+      with ThreadPoolExecutor(max_workers=len(wave)) as executor:
+        results = list(executor.map(lambda shard: apply_shard_deletes(args.env_name, shard, shard_folders[shard]), wave))
+
+      if not all(results):
+        raise SystemExit(f"Shard deletes failed: {[s for s, ok in zip(wave, results) if not ok]}")
+
+  # dependent shards read outputs of their dependencies from remote state, so a wave starts only when previous one succeeded
+  planned = []
+  for idx, wave in enumerate(waves):
+    print(f"Running {args.action} of shards: {wave}")
+    with ThreadPoolExecutor(max_workers=len(wave)) as executor:
+      results = list(executor.map(lambda shard: run_shard(args.env_name, shard, shard_folders[shard], args.action), wave))
+
+    failed = [s for s, ok in zip(wave, results) if not ok]
+    planned += [s for s, ok in zip(wave, results) if ok]
+    # without apply, dependent shards are planned against last applied outputs of their dependencies, not against the plans above
+    if args.action == 'plan' and idx > 0:
+      print(f"Plans of shards {wave} are provisional, they use outputs of previous waves as last applied")
+      if failed:
+        print(f"- Provisional plans failed: {failed}, they can succeed once previous waves are applied")
+      continue
+
+    if failed:
+      raise SystemExit(f"Shards failed: {failed}")
+
+  if args.action == 'plan' and not validate_shard_plans(args.env_name, [shard_folders[s] for s in planned]):
+    raise SystemExit("Plan validation of shards failed")
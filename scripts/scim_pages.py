@@ -0,0 +1,23 @@
+from typing import Iterator, Any, Callable
+
+# Account SCIM API may return fewer items than requested even when more pages follow, so listing reads pages until an empty one
+SCIM_PAGE_SIZE = 100
+
+def list_all_scim_pages(list_fn: Callable, attributes: str, page_size: int=SCIM_PAGE_SIZE) -> Iterator[Any]:
+  """reads all pages of account SCIM listing, sdk returns only one page per call
+
+  Args:
+      list_fn (Callable): sdk SCIM list method, i.e. `ac.groups.list` or `ac.service_principals.list`
+      attributes (str): comma separated attributes to return
+      page_size (int): number of items requested per page (default: SCIM_PAGE_SIZE)
+
+  Yields:
+      Iterator[Any]: listed items
+  """
+  start_index = 1
+  while True:
+    page = list_fn(attributes=attributes, start_index=start_index, count=page_size)
+    if not page:
+      break
+    yield from page
+    start_index += len(page)
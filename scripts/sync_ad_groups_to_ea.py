@@ -1,38 +1,152 @@
 import requests
+from requests.adapters import HTTPAdapter
 from databricks.sdk import AccountClient
 from databricks.sdk.core import DatabricksError
 from databricks.sdk.service import iam
+from concurrent.futures import ThreadPoolExecutor
 import argparse
 import json
+import os
+import re
+import time
+import threading
+from urllib.parse import quote
+from scim_pages import list_all_scim_pages
 
-def get_access_token(spn_id, spn_key):
-    post_data = {'client_id': spn_id,
-                 'scope': 'https://graph.microsoft.com/.default',
-                 'client_secret': spn_key,
-                 'grant_type': 'client_credentials'}
-    initial_header = {'Content-type': 'application/x-www-form-urlencoded'}
-    response = requests.post(
-        f"https://login.microsoftonline.com/{tenant_id}/oauth2/v2.0/token", data=post_data, headers=initial_header)
-    return response.json().get("access_token")
+GRAPH_BATCH_SIZE = 20
+GRAPH_ID_PATTERN = re.compile(r"[0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{12}")
+
+class GraphClient:
+    """Microsoft Graph access shared by all sync steps: one pooled keep-alive session, client credentials token cached until
+    shortly before it expires, backoff while throttled, and request count, time and bytes per endpoint
+    """
+    def __init__(self, tenant_id, client_id, client_secret, base_url, pool_size=8, token_refresh_margin=300):
+        self.tenant_id = tenant_id
+        self.client_id = client_id
+        self.client_secret = client_secret
+        self.base_url = base_url
+        self.token_refresh_margin = token_refresh_margin
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount("https://", adapter)
+        self._token = None
+        self._token_expires_at = 0
+        self._token_lock = threading.Lock()
+        self._stats = {}
+        self._stats_lock = threading.Lock()
+
+    def get_access_token(self, force_refresh=False):
+        with self._token_lock:
+            if force_refresh or self._token is None or time.time() >= self._token_expires_at - self.token_refresh_margin:
+                post_data = {'client_id': self.client_id,
+                             'scope': 'https://graph.microsoft.com/.default',
+                             'client_secret': self.client_secret,
+                             'grant_type': 'client_credentials'}
+                initial_header = {'Content-type': 'application/x-www-form-urlencoded'}
+                response = self._send("POST",
+                    f"https://login.microsoftonline.com/{self.tenant_id}/oauth2/v2.0/token", data=post_data, headers=initial_header)
+                token = response.json()
+                self._token = token.get("access_token")
+                self._token_expires_at = time.time() + int(token.get("expires_in", 3600))
+            return self._token
+
+    def _record(self, method, url, response, seconds):
+        # Ids and query are dropped, so calls of one endpoint are counted together
+        endpoint = f"{method} {GRAPH_ID_PATTERN.sub('{id}', url.split('?')[0])}"
+        with self._stats_lock:
+            stats = self._stats.setdefault(endpoint, {"count": 0, "seconds": 0.0, "bytes": 0})
+            stats["count"] += 1
+            stats["seconds"] += seconds
+            stats["bytes"] += len(response.content)
+
+    def _send(self, method, url, **kwargs):
+        start = time.perf_counter()
+        response = self.session.request(method, url, **kwargs)
+        self._record(method, url, response, time.perf_counter() - start)
+        return response
+
+    def request(self, method, url, max_retries=5, **kwargs):
+        """sends authorized request to Microsoft Graph, backing off while throttled (HTTP 429/503 honouring Retry-After)"""
+        headers = kwargs.pop("headers", {})
+        refreshed = False
+        force_refresh = False
+        for attempt in range(max_retries + 1):
+            auth_header = {"Authorization": f"Bearer {self.get_access_token(force_refresh)}"}
+            force_refresh = False
+            response = self._send(method, url, headers={**headers, **auth_header}, **kwargs)
+            if response.status_code == 401 and not refreshed:
+                # Token revoked or expired earlier than announced
+                refreshed = force_refresh = True
+                continue
+            if response.status_code not in (429, 503) or attempt == max_retries:
+                return response
+
+            retry_after = response.headers.get("Retry-After")
+            delay = float(retry_after) if retry_after and retry_after.isdigit() else min(2 ** attempt, 30)
+            print(f"\t Throttled by Graph ({response.status_code}), retrying in {delay}s -> {url}")
+            time.sleep(delay)
+        return response
+
+    def batch(self, sub_requests, executor=None, max_retries=5):
+        """sends GET sub-requests to Graph JSON $batch endpoint in batches of up to 20, throttled sub-requests are retried individually
+
+        Args:
+            sub_requests (dict): request id -> Graph URL relative to base_url, i.e. "/groups/{id}/members"
+            executor (ThreadPoolExecutor): when set, batches are sent concurrently
+            max_retries (int): number of retries of throttled sub-requests
+
+        Returns:
+            dict: request id -> {"status": ..., "body": ...} of each sub-request
+        """
+        def send_batch(ids):
+            batch = {"requests": [{"id": i, "method": "GET", "url": sub_requests[i]} for i in ids]}
+            response = self.request("POST", f"{self.base_url}/$batch", json=batch)
+            if response.status_code != 200:
+                return {i: {"status": response.status_code, "body": response.text, "headers": {}} for i in ids}
+            return {r["id"]: r for r in response.json().get("responses", [])}
+
+        results = {}
+        pending = list(sub_requests)
+        for attempt in range(max_retries + 1):
+            chunks = [pending[i:i + GRAPH_BATCH_SIZE] for i in range(0, len(pending), GRAPH_BATCH_SIZE)]
+            batch_results = executor.map(send_batch, chunks) if executor else map(send_batch, chunks)
+            for r in batch_results:
+                results.update(r)
+
+            throttled = [i for i in pending if results.get(i, {}).get("status") in (429, 503)]
+            if not throttled or attempt == max_retries:
+                break
+
+            retry_after = [str(results[i].get("headers", {}).get("Retry-After", "")) for i in throttled]
+            delay = max([float(r) for r in retry_after if r.isdigit()], default=min(2 ** attempt, 30))
+            print(f"\t Throttled by Graph in $batch, retrying {len(throttled)} sub-request(s) in {delay}s")
+            time.sleep(delay)
+            pending = throttled
+
+        return results
+
+    def print_stats(self):
+        print("Graph requests:")
+        for endpoint, stats in sorted(self._stats.items()):
+            print(f"\t{endpoint} : {stats['count']} request(s), {stats['seconds']:.2f}s, {stats['bytes']} bytes")
 
 def find_current_groups_in_ea(sp_object_id):
-    def extract_dict(resp_list):
-        return [{
-            "groupName": grp.get("principalDisplayName").lower(),
-            "groupId": grp.get("principalId"),
-            "assignmentId": grp.get("id")
-            } for grp in resp_list]
-            
-    all_data = []
-    header = {"Authorization": f"Bearer {token}"}
-    req_url = f"{base_url}/servicePrincipals/{sp_object_id}/appRoleAssignedTo"
+    """reads groups assigned to Enterprise App, pages of maximum size with only needed fields are streamed into index by lowercase group name"""
+    existing_groups = {}
+    req_url = f"{base_url}/servicePrincipals/{sp_object_id}/appRoleAssignedTo?$top=999&$select=principalDisplayName,principalId,id"
 
     while req_url:
-        response = requests.get(req_url, headers=header)
+        response = graph.request("GET", req_url)
 
         if response.status_code == 200:
             data = response.json()
-            all_data.extend(extract_dict(data['value']))
+            for grp in data['value']:
+                group_name = grp.get("principalDisplayName").lower()
+                existing_groups[group_name] = {
+                    "groupName": group_name,
+                    "groupId": grp.get("principalId"),
+                    "assignmentId": grp.get("id")
+                }
 
             # Check if there are more pages
             req_url = data.get('@odata.nextLink')
@@ -40,103 +154,189 @@ def find_current_groups_in_ea(sp_object_id):
             print(f"Error: {response.status_code} - {response.text}")
             break
 
-    return all_data 
+    return existing_groups
 
 
-def get_group_id(name):
-    response = requests.get(
-        f"{base_url}/groups?$filter=startswith(displayName,'{name}')&$count=true&$top=1", headers=header)
-    if response.status_code == 200:
-        res_json = response.json().get("value")
+def get_group_search_url(name):
+    # quotes are escaped for OData string literal, the name is then URL encoded so "&", "#" or spaces do not break the query
+    value = quote(name.replace("'", "''"), safe="")
+    return f"/groups?$filter=startswith(displayName,'{value}')&$count=true&$top=1"
+
+def extract_group(name, status_code, body):
+    if status_code == 200:
+        res_json = body.get("value")
         if len(res_json) == 1:
             group = res_json[0]
             return ({"groupId": group.get("id"), "groupName": group.get("displayName")})
         else : 
-            print(f"Group - {name} search failed : {response.json()}")
+            print(f"Group - {name} search failed : {body}")
             return None
 
+def get_group_ids(names, executor=None):
+    """resolves group names to Entra ID groups using Graph $batch, returns name -> group (None if not found)"""
+    responses = graph.batch({str(i): get_group_search_url(name) for i, name in enumerate(names)}, executor)
+    return {
+        name: extract_group(name, responses[str(i)].get("status"), responses[str(i)].get("body"))
+        for i, name in enumerate(names)
+    }
+
+def get_groups_spns(groups, executor=None):
+    """lists service principal members of groups using Graph $batch, returns group id -> list of SPNs (None if listing failed)"""
+    responses = graph.batch({
+        g.get("groupId"): f"/groups/{g.get('groupId')}/members/microsoft.graph.servicePrincipal"
+        for g in groups
+    }, executor)
+
+    groups_spns = {}
+    for g in groups:
+        r = responses[g.get("groupId")]
+        if r.get("status") == 200:
+            groups_spns[g.get("groupId")] = r.get("body").get("value")
+        else:
+            print(f"\t Listing Service Principals of the group -> {g.get('groupName')} failed : {r.get('status')} - {r.get('body')}")
+            groups_spns[g.get("groupId")] = None
+    return groups_spns
+
 
 def add_group_to_ea(group):
     group_id = group.get("groupId")
     group_name = group.get("groupName")
-    header = {"Authorization": f"Bearer {token}",
-              'Content-type': 'application/json'}
     post_data = {
         "principalId": group_id,
         "resourceId": sp_object_id,
         "appRoleId": spn_app.get("roleId")
     }
-    response = requests.post(
-        f"{base_url}/servicePrincipals/{sp_object_id}/appRoleAssignedTo", headers=header, json=post_data)
+    response = graph.request("POST",
+        f"{base_url}/servicePrincipals/{sp_object_id}/appRoleAssignedTo", json=post_data)
 
     if (response.status_code == 201):
         print(f"\t Successfully added group -> {group_name} to Enterprise App")
+        return "added"
+    elif (response.status_code == 400 and "already exists" in response.text):
+        print(f"\t Group already assigned to Enterprise App -> {group_name}")
+        return "exists"
+    else:
+        print(f"\t Adding group -> {group_name} to Enterprise App failed : {response.status_code} - {response.text}")
+        return f"failed ({response.status_code})"
+
+def get_account_snapshot():
+    """takes one snapshot of Databricks account groups with their members and service principals, indexed for the local diff
+
+    Returns:
+        dict: "groups" - lowercase group name -> {"id", "display_name", "member_ids"}, "spns" - application id -> Databricks id
+    """
+    groups = {
+        g.display_name.lower(): {
+            "id": g.id,
+            "display_name": g.display_name,
+            "member_ids": {m.value for m in g.members} if g.members is not None else set()
+        }
+        for g in list_all_scim_pages(ac.groups.list, "id,displayName,members")
+    }
+    spns = {
+        sp.application_id: sp.id
+        for sp in list_all_scim_pages(ac.service_principals.list, "id,applicationId")
+    }
+    print(f"Databricks account snapshot : {len(groups)} group(s), {len(spns)} service principal(s)")
+    return {"groups": groups, "spns": spns}
+
+def add_group_to_databricks_account(group, snapshot):
+    db_group = snapshot["groups"].get(group.lower())
+    if db_group is not None:
+        print(f"\t Group already exists in Databricks -> {group}" )
+        return "exists"
 
-def add_group_to_databricks_account(group):
     try :
-        group = ac.groups.create(id="",display_name=group)
+        created = ac.groups.create(id="",display_name=group)
+        snapshot["groups"][group.lower()] = {"id": created.id, "display_name": created.display_name, "member_ids": set()}
         print(f"\t Successfully added group into Databricks -> {group} ")
+        return "created"
     except DatabricksError as e:
         if "already exists" in e.__str__() :
+            # Created since the snapshot was taken
+            filter_query = f'displayName eq "{group}"'
+            existing = ac.groups.list(filter=filter_query, attributes="id,displayName,members")[0]
+            snapshot["groups"][group.lower()] = {
+                "id": existing.id,
+                "display_name": existing.display_name,
+                "member_ids": {m.value for m in existing.members} if existing.members is not None else set()
+            }
             print(f"\t Group already exists in Databricks -> {group}" )
+            return "exists"
+        print(f"\t Adding group into Databricks failed -> {group} : {e.__str__()}")
+        return "failed"
 
-def add_spns_to_databricks_account(group):
-    group_id = group.get("groupId")
-    group_name = group.get("groupName")
-    response = requests.get(f"{base_url}/groups/{group_id}/members/microsoft.graph.servicePrincipal", headers=header)
-    if(response.status_code == 200):
-        res_json = response.json().get("value")
-        if len(res_json) > 0 :
-            for spn in res_json : 
-                spn_app_id = spn.get("appId")
-                try :
-                    db_spn = ac.service_principals.create(application_id=spn_app_id)
-                    spn["db_id"] = db_spn.id
-                    add_spn_to_databricks_group(spn,group)
-                except DatabricksError as e:
-                    if "already exists in this account" in e.__str__() :
-                        filter_query = f'applicationId eq "{spn.get("appId")}"'
-                        resp = ac.service_principals.list(filter=filter_query)
-                        spn["db_id"] = resp[0].id
-                        print(f"\t Service Principal already exists in Databricks -> {spn_app_id} ")
-                        add_spn_to_databricks_group(spn,group)
-                        break
-        else :
-            print(f"\t No  Service Principals present in the group -> {group_name}")
-
-def add_spn_to_databricks_group(spn, group):
+def create_databricks_spn(spn_app_id, snapshot):
+    try :
+        db_spn = ac.service_principals.create(application_id=spn_app_id)
+        snapshot["spns"][spn_app_id] = db_spn.id
+        print(f"\t Successfully added Service Principal into Databricks -> {spn_app_id} ")
+        return "created"
+    except DatabricksError as e:
+        if "already exists in this account" in e.__str__() :
+            # Created since the snapshot was taken
+            filter_query = f'applicationId eq "{spn_app_id}"'
+            resp = ac.service_principals.list(filter=filter_query)
+            snapshot["spns"][spn_app_id] = resp[0].id
+            print(f"\t Service Principal already exists in Databricks -> {spn_app_id} ")
+            return "exists"
+        else:
+            print(f"\t Adding Service Principal into Databricks failed -> {spn_app_id} : {e.__str__()}")
+            return "failed"
+
+def add_spns_to_databricks_group(group, spns, snapshot):
+    """adds all group SPNs missing in Databricks group with single PATCH, returns number of SPNs in the group (None on failure)"""
     group_name = group.get("groupName")
-    spn_app_id = spn.get("appId")
-    filter_query = f'displayName eq "{group_name}"'
-    resp = ac.groups.list(filter=filter_query)
-    if(len(resp) == 1):
-        db_group = resp[0]
-        members_list = [d.display for d in db_group.members] if db_group.members is not None else []
-        if(not spn_app_id in members_list) :
-            value= {'members' : [{'value': spn.get("db_id")}]}
-            operation = [iam.Patch(op=iam.PatchOp.ADD,value=value)]
-            try: 
-                ac.groups.patch(db_group.id,
-                            schema=[iam.PatchSchema.URN_IETF_PARAMS_SCIM_API_MESSAGES_2_0_PATCH_OP],
-                            operations=operation)
-                print(f"\t Successfully added Service Principal -> {spn_app_id} to Group -> {db_group.display_name} in Databricks.")
-            except DatabricksError as e:
-                print(f"\t Patch API failed with error : {e.__str__()}")
-        else :
-            print(f"\t Service Principal {spn_app_id} is already present in Databricks group -> {db_group.display_name}" )
+    if(spns is None):
+        return None
+    if len(spns) == 0 :
+        print(f"\t No  Service Principals present in the group -> {group_name}")
+        return 0
+
+    db_group = snapshot["groups"].get(group_name.lower())
+    if(db_group is None):
+        print(f"\t Group -> {group_name} not found in Databricks, skip adding Service Principals")
+        return None
+
+    missing_spns = [spn for spn in spns if spn.get("appId") not in snapshot["spns"]]
+    for spn in missing_spns:
+        print(f"\t Service Principal {spn.get('appId')} is not present in Databricks, skip adding to group -> {group_name}")
+
+    new_members = sorted({
+        snapshot["spns"][spn.get("appId")]
+        for spn in spns
+        if spn.get("appId") in snapshot["spns"]
+    } - db_group["member_ids"])
+    if(len(new_members) == 0):
+        print(f"\t All Service Principals are already present in Databricks group -> {db_group['display_name']}" )
+        return None if missing_spns else len(spns)
+
+    value= {'members' : [{'value': m} for m in new_members]}
+    operation = [iam.Patch(op=iam.PatchOp.ADD,value=value)]
+    try: 
+        ac.groups.patch(db_group["id"],
+                    schemas=[iam.PatchSchema.URN_IETF_PARAMS_SCIM_API_MESSAGES_2_0_PATCH_OP],
+                    operations=operation)
+        db_group["member_ids"].update(new_members)
+        print(f"\t Successfully added {len(new_members)} Service Principal(s) to Group -> {db_group['display_name']} in Databricks.")
+    except DatabricksError as e:
+        print(f"\t Patch API failed with error : {e.__str__()}")
+        return None
+
+    return None if missing_spns else len(spns)
 
 def remove_group_from_ea(group):
     assignment_id = group.get("assignmentId")
     group_name = group.get("groupName")
-    response = requests.delete(
-        f"{base_url}/servicePrincipals/{sp_object_id}/appRoleAssignedTo/{assignment_id}", headers=header)
+    response = graph.request("DELETE",
+        f"{base_url}/servicePrincipals/{sp_object_id}/appRoleAssignedTo/{assignment_id}")
     if (response.status_code == 204):
         print(f"\tSuccessfully removed group -> {group_name}")
 
 
 def find_app(appName):
-    response = requests.get(
-        f"{base_url}/servicePrincipals?$filter=startswith(displayName,'{appName}')&$count=true&$top=1", headers=header)
+    response = graph.request("GET",
+        f"{base_url}/servicePrincipals?$filter=startswith(displayName,'{appName}')&$count=true&$top=1")
     if response.status_code == 200:
         if len(response.json().get("value")) == 1:
             group = response.json().get("value")[0]
@@ -148,6 +348,172 @@ def find_app(appName):
     else :
         print(f"SPN app - {app_name} search failed : {response.json()}")
 
+def get_sync_plan(add_groups, resolved_groups, groups_spns, snapshot):
+    """computes change set of Enterprise App assignments, account groups, service principals and group memberships
+
+    Returns:
+        dict: "operations" - list of operations, each with unique "id" used by the checkpoint journal, "skipped_groups" - group name -> reason
+    """
+    create_spns = {}
+    operations = []
+    skipped_groups = {}
+
+    for name in sorted(add_groups):
+        grp = resolved_groups.get(name)
+        if(grp is None):
+            print(f"Skip processing {name} as its not a valid group name.")
+            skipped_groups[name] = "not a valid group name"
+            continue
+
+        group_id = grp.get("groupId")
+        group_name = grp.get("groupName")
+        operations.append({"id": f"ea_assign:{group_id}", "op": "ea_assign", "group": name, "group_id": group_id, "group_name": group_name})
+
+        db_group = snapshot["groups"].get(group_name.lower())
+        if(db_group is None):
+            operations.append({"id": f"create_group:{group_name.lower()}", "op": "create_group", "group": name, "group_name": group_name})
+
+        spns = groups_spns.get(group_id)
+        if(spns is None):
+            skipped_groups[name] = "listing of Service Principals failed"
+            continue
+
+        member_ids = db_group["member_ids"] if db_group is not None else set()
+        application_ids = sorted({
+            spn.get("appId")
+            for spn in spns
+            if snapshot["spns"].get(spn.get("appId")) not in member_ids
+        })
+        for app_id in application_ids:
+            if app_id not in snapshot["spns"]:
+                create_spns[app_id] = {"id": f"create_spn:{app_id}", "op": "create_spn", "group": None, "application_id": app_id}
+        if application_ids:
+            operations.append({"id": f"add_members:{group_name.lower()}", "op": "add_members", "group": name, "group_name": group_name, "application_ids": application_ids})
+
+    return {"operations": list(create_spns.values()) + operations, "skipped_groups": skipped_groups}
+
+def print_sync_plan(plan):
+    counts = {}
+    for op in plan["operations"]:
+        counts[op["op"]] = counts.get(op["op"], 0) + 1
+    print(f"Sync plan : {len(plan['operations'])} operation(s) - " + ", ".join(f"{k}: {v}" for k, v in sorted(counts.items())))
+    for op in plan["operations"]:
+        print(f"\t{op['id']}")
+
+journal_lock = threading.Lock()
+
+def load_journal(journal_file):
+    """reads ids of operations completed by previous runs from JSON-lines checkpoint journal"""
+    done = set()
+    if journal_file is None:
+        return done
+    try:
+        with open(journal_file) as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    # Last line can be partial when previous run was killed while writing it
+                    continue
+                if entry.get("status") == "done":
+                    done.add(entry.get("id"))
+    except FileNotFoundError:
+        pass
+    return done
+
+def append_journal(journal_file, op_id, status):
+    if journal_file is None:
+        return
+    with journal_lock:
+        with open(journal_file, "a") as f:
+            f.write(json.dumps({"id": op_id, "status": status, "time": time.time()}) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+def run_sync_operation(op, snapshot):
+    """executes one plan operation, returns (status, is_done)"""
+    kind = op["op"]
+    try:
+        if kind == "ea_assign":
+            if op["group_id"] in snapshot.get("ea_group_ids", set()):
+                print(f"\t Group already assigned to Enterprise App -> {op['group_name']}")
+                return "exists", True
+            status = add_group_to_ea({"groupId": op["group_id"], "groupName": op["group_name"]})
+            return status, status in ("added", "exists")
+        if kind == "create_group":
+            status = add_group_to_databricks_account(op["group_name"], snapshot)
+            return status, status != "failed"
+        if kind == "create_spn":
+            status = create_databricks_spn(op["application_id"], snapshot)
+            return status, status != "failed"
+        if kind == "add_members":
+            added = add_spns_to_databricks_group({"groupName": op["group_name"]}, [{"appId": a} for a in op["application_ids"]], snapshot)
+            return ("failed", False) if added is None else (f"{added} SPN(s)", True)
+        return f"failed (unknown operation {kind})", False
+    except Exception as e:
+        print(f"\t Operation {op['id']} failed with error : {e.__str__()}")
+        return f"failed ({e.__str__()})", False
+
+def apply_sync_plan(plan, snapshot, executor, journal_file=None):
+    """applies sync plan, operations recorded as done in the journal are skipped and each completed one is appended to it, so rerun resumes where previous one stopped
+
+    Returns:
+        dict: operation id -> status
+    """
+    done = load_journal(journal_file)
+    if done:
+        print(f"Resuming from journal {journal_file} : {len(done)} operation(s) already completed")
+
+    def run(op):
+        if op["id"] in done:
+            return op["id"], "done earlier"
+        print(f"Processing {op['id']}.")
+        status, is_done = run_sync_operation(op, snapshot)
+        if is_done:
+            append_journal(journal_file, op["id"], "done")
+        return op["id"], status
+
+    statuses = {}
+    # Memberships need ids of groups and service principals created in the first wave
+    first_wave = [op for op in plan["operations"] if op["op"] != "add_members"]
+    second_wave = [op for op in plan["operations"] if op["op"] == "add_members"]
+    for wave in (first_wave, second_wave):
+        statuses.update(executor.map(run, wave))
+    return statuses
+
+def get_sync_results(plan, statuses):
+    """groups operation statuses by requested group for the summary"""
+    results = {name: {"group": name, "status": "skipped", "operations": {}, "error": reason} for name, reason in plan["skipped_groups"].items()}
+    for op in plan["operations"]:
+        if op["group"] is None:
+            continue
+        r = results.setdefault(op["group"], {"group": op["group"], "status": "ok", "operations": {}})
+        status = statuses.get(op["id"], "not run")
+        r["operations"][op["op"]] = status
+        if status.startswith("failed") or status == "not run":
+            r["status"] = "failed"
+
+    spn_failures = [op["application_id"] for op in plan["operations"] if op["op"] == "create_spn" and statuses.get(op["id"], "").startswith("failed")]
+    if spn_failures:
+        print(f"Service Principals failed to be added to Databricks : {spn_failures}")
+    return list(results.values())
+
+def print_sync_summary(results):
+    print("Summary:")
+    for r in sorted(results, key=lambda r: r["group"]):
+        details = ", ".join(f"{k}: {v}" for k, v in r["operations"].items()) or "nothing to do"
+        if r.get("error"):
+            details = f"{details}, error: {r['error']}"
+        print(f"\t{r['status'].upper():8} {r['group']} - {details}")
+
+    counts = {}
+    for r in results:
+        counts[r["status"]] = counts.get(r["status"], 0) + 1
+    print(f"Total : {len(results)} group(s) - " + ", ".join(f"{k}: {v}" for k, v in sorted(counts.items())))
+
 if __name__ == "__main__":
 
     base_url = "https://graph.microsoft.com/beta"
@@ -158,18 +524,21 @@ if __name__ == "__main__":
     arg_parser.add_argument("tenant_id", help="Tenant Id")
     arg_parser.add_argument("spn_id", help="Deployment SPN ID")
     arg_parser.add_argument("spn_key", help="Deployment SPN Secret Key")
+    arg_parser.add_argument("--workers", type=int, default=8, help="Number of groups processed concurrently")
+    arg_parser.add_argument("--plan-out", help="Only compute changes and write them to this plan file, nothing is changed")
+    arg_parser.add_argument("--apply-plan", help="Apply changes from this plan file instead of computing them")
+    arg_parser.add_argument("--journal", help="Checkpoint journal of completed operations (default: <plan file>.journal when applying plan file)")
     args = vars(arg_parser.parse_args())
 
     groups_file_name = args["json_file_name"]
     app_name = args["app_name"]
     tenant_id = args["tenant_id"] # Azure Tenant id
-    token = get_access_token(args["spn_id"], args['spn_key'])
+    graph = GraphClient(tenant_id, args["spn_id"], args['spn_key'], base_url, pool_size=args["workers"])
 
     f = open(groups_file_name)
     all_groups = json.load(f)
     current_list = [x.lower() for x in all_groups]
     
-    header = {"Authorization": f"Bearer {token}"}
     spn_app = find_app(app_name)
     sp_object_id = spn_app.get("objectId")
 
@@ -181,32 +550,51 @@ if __name__ == "__main__":
                     ,debug_truncate_bytes = 1000
                     )
     
-    existing_groups = find_current_groups_in_ea(spn_app.get("objectId"))
-    existing_groups_list = [d.get('groupName') for d in existing_groups]
-    print(f"Total count of groups in Enterprise App : {len(existing_groups_list)}")
-
-    # Add new groups
-    add_groups = list(set(current_list) - set(existing_groups_list))
-
-    print(f"Total Count of Groups to be added : {len(add_groups)}")
-    print(f"Groups to be added : {add_groups}")
-
-    for g in add_groups:
-        print(f"Processing Group -> {g}.")
-        grp = get_group_id(g)
-        if(grp is not None):
-            add_group_to_ea(grp)
-            add_group_to_databricks_account(grp.get("groupName"))
-            add_spns_to_databricks_account(grp)
+    journal_file = args["journal"] or (f"{args['apply_plan']}.journal" if args["apply_plan"] else None)
+
+    # Databricks SDK retries throttled (429) account API calls on its own, Graph calls back off in GraphClient
+    with ThreadPoolExecutor(max_workers=max(1, args["workers"])) as executor:
+        if args["apply_plan"]:
+            with open(args["apply_plan"]) as f:
+                plan = json.load(f)
+            # Snapshot is taken again, so ids of objects created by interrupted run are known
+            snapshot = get_account_snapshot()
+            # Assignments made by interrupted run are not journaled when it died right after them
+            snapshot["ea_group_ids"] = {g["groupId"] for g in find_current_groups_in_ea(sp_object_id).values()}
+        else:
+            existing_groups = find_current_groups_in_ea(spn_app.get("objectId"))
+            print(f"Total count of groups in Enterprise App : {len(existing_groups)}")
+
+            # Add new groups
+            add_groups = list(set(current_list) - existing_groups.keys())
+
+            print(f"Total Count of Groups to be added : {len(add_groups)}")
+            print(f"Groups to be added : {add_groups}")
+
+            # Resolve groups and their SPN members up front, with up to 20 Graph lookups per request
+            resolved_groups = get_group_ids(add_groups, executor)
+            groups_spns = get_groups_spns([grp for grp in resolved_groups.values() if grp is not None], executor)
+
+            # Diff against one account snapshot instead of SCIM filter queries per group and SPN
+            snapshot = get_account_snapshot()
+            snapshot["ea_group_ids"] = {g["groupId"] for g in existing_groups.values()}
+            plan = get_sync_plan(add_groups, resolved_groups, groups_spns, snapshot)
+
+        print_sync_plan(plan)
+        if args["plan_out"]:
+            with open(args["plan_out"], "w") as f:
+                json.dump(plan, f, indent=2)
+            print(f"Sync plan written to {args['plan_out']}")
         else:
-            print(f"Skip processing {g} as its not a valid group name.")
+            statuses = apply_sync_plan(plan, snapshot, executor, journal_file)
+            print_sync_summary(get_sync_results(plan, statuses))
+
+    graph.print_stats()
 
     # Commenting out group removal logic.
 
     # # Remove stale groups
-    # remove_groups = list(set(existing_groups_list) - set(current_list))
+    # remove_groups = list(existing_groups.keys() - set(current_list))
     # print(f"Groups to be removed : {remove_groups}")
     # for g in remove_groups:
-    #     for grp in existing_groups:
-    #         if (g == grp.get("groupName")):
-    #             remove_group_from_ea(grp)
+    #     remove_group_from_ea(existing_groups[g])
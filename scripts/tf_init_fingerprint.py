@@ -0,0 +1,66 @@
+import os
+import sys
+import glob
+import hashlib
+import argparse
+
+FINGERPRINT_FILE = '.terraform/init-fingerprint'
+
+def get_init_files():
+  """gets files which decide the outcome of terraform init: backend / providers config, lock file and all modules,
+  dynamic-imports.tf only holds import blocks and is rebuilt on every run, so it's excluded
+  """
+  tf_files = glob.glob('*.tf') + glob.glob('modules/**/*.tf', recursive=True)
+  return sorted(
+    f.replace(os.sep, '/')
+    for f in tf_files + ['.terraform.lock.hcl']
+    if os.path.basename(f) != 'dynamic-imports.tf'
+  )
+
+def get_init_fingerprint(env_name: str) -> str:
+  """computes fingerprint of terraform init inputs and selected workspace
+
+  Args:
+      env_name (str): name of the environment / terraform workspace
+
+  Returns:
+      str: sha256 hex digest
+  """
+  h = hashlib.sha256()
+  h.update(f"env:{env_name}\n".encode())
+
+  try:
+    with open('.terraform/environment') as f:
+      h.update(f"workspace:{f.read().strip()}\n".encode())
+  except FileNotFoundError:
+    h.update(b"workspace:\n")
+
+  for file_name in get_init_files():
+    h.update(f"file:{file_name}\n".encode())
+    try:
+      with open(file_name, 'rb') as f:
+        h.update(hashlib.sha256(f.read()).digest())
+    except FileNotFoundError:
+      h.update(b"missing")
+
+  return h.hexdigest()
+
+if __name__ == "__main__":
+  arg_parser = argparse.ArgumentParser(description="Checks (exit code 0 when unchanged) or saves fingerprint of terraform init inputs")
+  arg_parser.add_argument("action", choices=['check', 'save'])
+  arg_parser.add_argument("env_name")
+  args = arg_parser.parse_args()
+
+  fingerprint = get_init_fingerprint(args.env_name)
+
+  if args.action == 'save':
+    with open(FINGERPRINT_FILE, 'w') as f:
+      f.write(fingerprint)
+  else:
+    try:
+      with open(FINGERPRINT_FILE) as f:
+        previous = f.read().strip()
+    except FileNotFoundError:
+      previous = None
+
+    sys.exit(0 if previous == fingerprint else 1)
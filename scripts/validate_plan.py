@@ -1,10 +1,16 @@
+import os
 import json
 import re
 import sys
+import mmap
+import time
+import codecs
+import itertools
 from datetime import datetime
 import argparse
+from concurrent.futures import ThreadPoolExecutor, Future
 from databricks.sdk import WorkspaceClient, AccountClient
-from typing import Optional
+from typing import Optional, Iterator, Iterable, List, Dict, Tuple, Callable
 
 def get_json_dict(file_name:str):
   with open(file_name) as json_file:
@@ -14,25 +20,233 @@ def get_json_dict(file_name:str):
     
     return d
   
-def validate_plan(tfplan):  
-  for rc in tfplan['resource_changes']:
-    yield from validate_resource_change(rc)
+def iter_plan_resource_changes(file_name: str, chunk_size: int=1024*1024) -> Iterator[dict]:
+  """streams entries of `resource_changes` section of `terraform show -json` output one at a time, without loading whole plan.
+  The section is located with a scan of memory mapped file, and then decoded incrementally. Reading stops at the end of the section, 
+  so `prior_state` and `configuration` (written after it by terraform) are never read.
+
+  Args:
+      file_name (str): path of the plan json file
+      chunk_size (int): number of bytes decoded at once (default: 1MB)
+
+  Yields:
+      Iterator[dict]: each resource change, in plan order
+  """
+  with open(file_name, 'rb') as f:
+    if os.fstat(f.fileno()).st_size == 0:
+      return
+    
+    with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+      m = re.search(rb'"resource_changes"\s*:\s*\[', mm)
+      if not m:
+        return
+      
+      decoder = json.JSONDecoder()
+      utf8 = codecs.getincrementaldecoder('utf-8')()
+      pos = m.end()
+      read_size = chunk_size
+      buf = ''
+      
+      while True:
+        buf = buf.lstrip(' \t\r\n,')
+        if buf.startswith(']'):
+          return
+        
+        try:
+          rc, end = decoder.raw_decode(buf)
+        except json.JSONDecodeError:
+          if pos >= len(mm):
+            raise
+          #entry does not fit in buffer yet, read more (growing the read to avoid re-parsing very big entries too often)
+          buf += utf8.decode(mm[pos:pos + read_size], final=pos + read_size >= len(mm))
+          pos += read_size
+          read_size *= 2
+          continue
+        
+        read_size = chunk_size
+        buf = buf[end:]
+        yield rc
+
+_plan_validators: List[dict] = []
+
+def plan_validator(*change_keys: Tuple[str, str], on_change: Optional[Callable]=None) -> Callable:
+  """registers function as validator of resource changes with given (resource type, action) keys.
+  Validator is called once, after the whole plan was read, with list of all matching changes (in plan order) and worker pool for its API calls, and yields found issues.
+  When `on_change` hook is set, it's called with each matching change and the worker pool as soon as the change is read from the plan,
+  so API checks can run while rest of the plan is still being streamed. Its results are passed to the validator as third argument.
+
+  Args:
+      change_keys (Tuple[str, str]): (terraform resource type, plan action) pairs the validator is interested in, i.e. `('databricks_catalog', 'delete')`
+      on_change (Optional[Callable]): hook `(change, executor) -> Any` called at dispatch time, usually submitting work to the executor
+
+  Returns:
+      Callable: decorator registering the function
+  """
+  def _register(fn):
+    _plan_validators.append({'name': fn.__name__, 'fn': fn, 'change_keys': list(change_keys), 'on_change': on_change})
+    return fn
+  
+  return _register
+
+def get_validators_dispatch_index(validators: List[dict]) -> Dict[Tuple[str, str], List[dict]]:
+  """builds index of validators by (resource type, action)
+
+  Args:
+      validators (List[dict]): registered validators
+
+  Returns:
+      Dict[Tuple[str, str], List[dict]]: dictionary of (resource type, action) to list of validators interested in such change
+  """
+  index = {}
+  for v in validators:
+    for key in v['change_keys']:
+      index.setdefault(key, []).append(v)
+  
+  return index
+
+def validate_plan(tfplan, workers=8):  
+  yield from validate_resource_changes(tfplan['resource_changes'], workers)
+
+def validate_resource_changes(resource_changes: Iterable[dict], workers=8, timings: Optional[Dict[str, dict]]=None):
+  """dispatches each resource change only to validators registered for its type and actions as it's read (running their `on_change` hooks),
+  and then runs each validator once
+
+  Args:
+      resource_changes (Iterable[dict]): `resource_changes` section of terraform plan
+      workers (int): number of concurrent API calls validators can make (default: 8)
+      timings (Optional[Dict[str, dict]]): when set, filled with number of changes and duration of each validator that was run
+
+  Yields:
+      Iterator[Exception]: issues found in the plan
+  """
+  dispatch_index = get_validators_dispatch_index(_plan_validators)
+  validator_changes = {}
+  validator_submitted = {}
+  validator_seconds = {}
+  
+  with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+    for rc in resource_changes:
+      matched = set()
+      for action in rc['change']['actions']:
+        for v in dispatch_index.get((rc['type'], action), []):
+          if v['name'] in matched:
+            continue
+          
+          matched.add(v['name'])
+          validator_changes.setdefault(v['name'], []).append(rc)
+          if v['on_change']:
+            start = time.perf_counter()
+            validator_submitted.setdefault(v['name'], []).append(v['on_change'](rc, executor))
+            validator_seconds[v['name']] = validator_seconds.get(v['name'], 0) + time.perf_counter() - start
+    
+    for v in _plan_validators:
+      changes = validator_changes.get(v['name'])
+      if not changes:
+        continue
       
-def validate_resource_change(changed_resource):
-  #print("################## changed:", changed_resource)
-  r_change = changed_resource['change']
-  
-  for action in r_change['actions']:
-    if action == "delete" and changed_resource['type'] == 'databricks_catalog':
-      catalog_name = changed_resource['index']
-      catalog_schemas = [ 
-        s.name 
-        for s in wc.schemas.list(catalog_name)
-        if not s.full_name.endswith('.information_schema')
-      ]
+      start = time.perf_counter()
+      if v['on_change']:
+        issues = list(v['fn'](changes, executor, validator_submitted[v['name']]))
+      else:
+        issues = list(v['fn'](changes, executor))
+      if timings is not None:
+        seconds = validator_seconds.get(v['name'], 0) + time.perf_counter() - start
+        timings[v['name']] = {'changes': len(changes), 'seconds': seconds}
       
-      if catalog_schemas:
-        yield ValueError(f"Cannot delete catalog {catalog_name}: catalog is not empty: {catalog_schemas}")
+      yield from issues
+
+def get_first_catalog_schema(catalog_name: str) -> Optional[str]:
+  """gets name of first schema of the catalog, other than information_schema
+
+  Args:
+      catalog_name (str): name of the catalog
+
+  Returns:
+      Optional[str]: name of the schema, None if catalog is empty
+  """
+  for s in wc.schemas.list(catalog_name):
+    if not s.full_name.endswith('.information_schema'):
+      return s.name
+  
+  return None
+
+def is_path_under(path: Optional[str], root: str) -> bool:
+  """checks if storage path is equal to, or located under root path
+
+  Args:
+      path (Optional[str]): storage path, i.e. abfss://container@account.dfs.core.windows.net/folder
+      root (str): root storage path
+
+  Returns:
+      bool: True if path is under root
+  """
+  if not path:
+    return False
+  
+  root = root.rstrip('/')
+  return path.rstrip('/') == root or path.startswith(root + '/')
+
+def submit_catalog_delete_check(rc: dict, executor: ThreadPoolExecutor) -> Tuple[str, Future]:
+  return rc['index'], executor.submit(get_first_catalog_schema, rc['index'])
+
+@plan_validator(('databricks_catalog', 'delete'), on_change=submit_catalog_delete_check)
+def validate_catalog_deletes(changes: List[dict], executor: ThreadPoolExecutor, checks: List[Tuple[str, Future]]):
+  """validates that catalogs deleted (or replaced) by the plan are empty, each catalog is checked concurrently as soon as it's read from the plan"""
+  for catalog_name, check in checks:
+    schema_name = check.result()
+    if schema_name:
+      yield ValueError(f"Cannot delete catalog {catalog_name}: catalog is not empty, it contains at least schema: {schema_name}")
+
+@plan_validator(('databricks_metastore', 'delete'))
+def validate_metastore_deletes(changes: List[dict], executor: ThreadPoolExecutor):
+  """metastore can never be deleted or replaced by the plan, as it would drop all catalogs of the environment"""
+  for rc in changes:
+    yield ValueError(f"Cannot delete or replace metastore {rc['address']}: all catalogs assigned to it would be lost")
+
+@plan_validator(('databricks_storage_credential', 'delete'), ('databricks_external_location', 'delete'))
+def validate_storage_credential_deletes(changes: List[dict], executor: ThreadPoolExecutor):
+  """validates that storage credentials deleted by the plan are not used by external locations which are not deleted by the same plan"""
+  credential_names = [rc['index'] for rc in changes if rc['type'] == 'databricks_storage_credential']
+  if not credential_names:
+    return
+  
+  deleted_locations = {rc['index'] for rc in changes if rc['type'] == 'databricks_external_location'}
+  locations = wc.external_locations.list()
+  
+  for credential_name in credential_names:
+    used_by = sorted(
+      l.name
+      for l in locations
+      if l.credential_name == credential_name and l.name not in deleted_locations
+    )
+    if used_by:
+      yield ValueError(f"Cannot delete storage credential {credential_name}: it is used by external location(s): {used_by}")
+
+@plan_validator(('databricks_external_location', 'delete'), ('databricks_catalog', 'delete'))
+def validate_external_location_deletes(changes: List[dict], executor: ThreadPoolExecutor):
+  """validates that external locations deleted by the plan do not hold storage root of catalogs which are not deleted by the same plan"""
+  deleted_locations = [
+    (rc['index'], (rc['change'].get('before') or {}).get('url'))
+    for rc in changes 
+    if rc['type'] == 'databricks_external_location'
+  ]
+  if not deleted_locations:
+    return
+  
+  deleted_catalogs = {rc['index'] for rc in changes if rc['type'] == 'databricks_catalog'}
+  catalogs = wc.catalogs.list()
+  
+  for location_name, url in deleted_locations:
+    if not url:
+      continue
+    
+    used_by = sorted(
+      c.name
+      for c in catalogs
+      if is_path_under(c.storage_root, url) and c.name not in deleted_catalogs
+    )
+    if used_by:
+      yield ValueError(f"Cannot delete external location {location_name}: it holds storage root of catalog(s): {used_by}")
         
 def raise_on_validation_error(validation_issues):
   if len(validation_issues):
@@ -48,7 +262,9 @@ def raise_on_validation_error(validation_issues):
 if __name__ == "__main__":
   arg_parser = argparse.ArgumentParser()
   arg_parser.add_argument("env_name")
-  arg_parser.add_argument("tfplan_json")
+  arg_parser.add_argument("tfplan_json", nargs='+', help="plan file(s) in json format, changes of several plans (i.e. of all shards) are validated together")
+  arg_parser.add_argument("--workers", type=int, default=8, help="number of concurrent api checks (default: 8)")
+  arg_parser.add_argument("--stream", action="store_true", help="stream resource_changes from plan file instead of loading whole plan into memory")
   args = arg_parser.parse_args()
     
   env_setup = get_json_dict(".metadata.tmp/current_environment.json")
@@ -61,6 +277,16 @@ if __name__ == "__main__":
   dbr_account_id = env_setup['databricks_account_id']
   wc = WorkspaceClient(host=dbr_host)
   
-  tfplan = get_json_dict(args.tfplan_json)
-  validation_issues = list(validate_plan(tfplan))
+  if args.stream:
+    resource_changes = itertools.chain.from_iterable(iter_plan_resource_changes(f) for f in args.tfplan_json)
+  else:
+    resource_changes = itertools.chain.from_iterable(get_json_dict(f)['resource_changes'] for f in args.tfplan_json)
+  
+  timings = {}
+  validation_issues = list(validate_resource_changes(resource_changes, args.workers, timings))
+  
+  print("Validators run:")
+  for name, t in timings.items():
+    print(f"- {name}: {t['changes']} change(s) in {t['seconds']:.2f}s")
+  
   raise_on_validation_error(validation_issues)
\ No newline at end of file
@@ -1,9 +1,5 @@
 locals {
-  storage_credentials_json = jsondecode(file("${path.module}/.metadata.tmp/storage-credentials.json"))
-  storage_credentials = {
-    for x in local.storage_credentials_json :
-    x.name => x if x.enabled
-  }
+  storage_credentials = jsondecode(file("${path.module}/.metadata.tmp/keyed/storage-credentials.json"))
 }
 
 # https://registry.terraform.io/providers/databricks/databricks/latest/docs/resources/storage_credential
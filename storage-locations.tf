@@ -1,9 +1,5 @@
 locals {
-  storage_locations_json = jsondecode(file("${path.module}/.metadata.tmp/storage-locations.json"))
-  storage_locations = {
-    for x in local.storage_locations_json :
-    x.name => x if x.enabled
-  }
+  storage_locations = jsondecode(file("${path.module}/.metadata.tmp/keyed/storage-locations.json"))
 
   storage_location_grants = {
     for name, x in local.storage_locations :
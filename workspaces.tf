@@ -1,22 +1,8 @@
 locals {
-  workspaces_json = [
-    for x in jsondecode(file("${path.module}/.metadata.tmp/workspaces.json")) :
-    merge(x, {
-      "workspace_name" = reverse(split("/", x["workspace_resource_id"]))[0]
-    })
-  ]
+  workspaces_by_name = jsondecode(file("${path.module}/.metadata.tmp/keyed/workspaces.json"))
 
-  workspaces_by_name = {
-    for x in local.workspaces_json :
-    x.workspace_name => x
-    if x.enabled
-  }
-
-  workspaces_by_id = {
-    for x in local.workspaces_json :
-    x.workspace_id => x
-    if x.enabled
-  }
+  workspace_configs = jsondecode(file("${path.module}/.metadata.tmp/workspace-configs.json"))
+  account_group_ids = jsondecode(file("${path.module}/.metadata.tmp/account-groups.json"))
 }
 
 module "dbr_workspace" {
@@ -28,7 +14,12 @@ module "dbr_workspace" {
     databricks.account = databricks.account
   }
   databricks_workspace_id = each.value.workspace_id
-  databricks_metastore_id = databricks_metastore.this.id
-
-  depends_on = [databricks_metastore.this]
+  databricks_metastore_id = local.metastore_id
+  role_admin              = local.workspace_configs[each.key].role_admin
+  default_catalog_name    = local.workspace_configs[each.key].default_catalog_name
+  aad_group_names         = local.workspace_configs[each.key].aad_group_names
+  aad_group_ids = {
+    for g in local.workspace_configs[each.key].aad_group_names :
+    g => local.account_group_ids[g]
+  }
 }
\ No newline at end of file